@@ -0,0 +1,638 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#  ============================================================================
+#
+#  SV56BENCH.PY
+#  ~~~~~~~~~~~~
+#
+#  Description:
+#  ~~~~~~~~~~~~
+#
+#  Benchmark and accuracy regression suite of the speech voltmeter. All the
+#  test signals are synthetic and deterministic, generated one second at a
+#  time (so hour-long signals are never held in memory):
+#
+#  speech ......... bursts of AR-filtered noise of random length and level,
+#                   separated by silence gaps with a faint noise floor
+#  tone ........... 1 kHz sine wave, peaking at -20 dB of full scale
+#  zeros .......... digital silence
+#  clipped ........ the speech signal, 20 dB louder and hard-clipped
+#
+#  Accuracy: the signals are measured at 8, 16 and 48 kHz by each way of
+#  running the speech voltmeter (reference loop, NumPy engine, integer PCM,
+#  float and int16 array state and merged shards) and the activity counts,
+#  active level, activity factor and RMS level are compared with the golden
+#  reference in sv56bench.json, produced by the reference loop (the port of
+#  the C code). Counts must match exactly, levels and activity within
+#  LEVEL_TOL and ACTIVITY_TOL; any difference fails the run. Each channel
+#  of an int16 array holding -32768 must also match, counts, sums and peak,
+#  the same channel measured on its own, and the activity prefix index must
+#  give the counts of the whole signal and reject empty or out of range
+#  queries.
+#
+#  Command-line checks: sv56demo is run, in processes of its own, on a
+#  speech signal; each documented exit value must be returned in its case,
+#  a checkpoint must only resume the range it was saved for, and a file
+#  normalized in place (also by sv56pipe) must come out as the output of
+#  the default mode.
+#
+#  Benchmark: for each sampling rate, duration and block size, the speed
+#  (samples/s), mean latency per call and peak memory of each engine, and
+#  of each stage of sv56demo (reading, measuring, equalizing, and the
+#  whole in-memory and streaming runs). Also, for each sampling rate and
+#  block size, the speed of n one-second signals (n in ARRAY_SIGNALS)
+#  measured together as an array (array/n), and one at a time by the
+#  NumPy engine (separate/n).
+#
+#  Usage:
+#  ~~~~~~
+#  $ sv56bench [-options]
+#  Options:
+#  ~~~~~~~~
+#  -update ........ regenerates the golden reference rather than checking it
+#  -noaccuracy .... skips the accuracy and command-line checks
+#  -nobench ....... skips the benchmark
+#  -rates r,... ... sampling rates of the benchmark [default: 8000,16000,48000]
+#  -durations s,... durations of the benchmark, in s [default: 1,10,60]
+#  -long .......... adds 600 s and 3600 s to the durations
+#  -blocks n,... .. block sizes of the benchmark [default: 256,4096,65536]
+#  -json file ..... also writes the results to `file', as JSON
+#
+#  Exit values:
+#  ~~~~~~~~~~~~
+#  0      success;
+#  1      accuracy regression.
+#
+#  ============================================================================
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+from svp56 import SVP56_state, SVP56_array_state, init_speech_voltmeter
+from svp56 import speech_voltmeter_accumulate, speech_voltmeter_pcm_accumulate
+from svp56 import speech_voltmeter_partial, speech_voltmeter_merge, W
+from svp56 import init_speech_voltmeter_array, speech_voltmeter_array_accumulate
+from svp56 import speech_voltmeter_array_finalize
+from svp56 import speech_voltmeter_index, speech_voltmeter_index_query
+from svp56 import ENGINE_REFERENCE, ENGINE_NUMPY
+import sv56demo
+from sv56wav import pcm_format, read_pcm, create_pcm
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sv56bench.json')
+SV56DEMO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sv56demo.py')
+SV56PIPE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sv56pipe.py')
+
+SIGNALS = ('speech', 'tone', 'zeros', 'clipped')
+RATES = (8000, 16000, 48000)
+DURATIONS = (1, 10, 60)
+LONG_DURATIONS = (600, 3600)
+BLOCKS = (256, 4096, 65536)
+ARRAY_SIGNALS = (8, 64, 256)
+
+GOLDEN_SECONDS = 5     # length of the signals of the accuracy checks, in [s]
+GOLDEN_BLOCK = 256     # block size of the accuracy checks
+LEVEL_TOL = 1e-6       # tolerance of the levels, in [dB]
+ACTIVITY_TOL = 1e-6    # tolerance of the activity factor, in [%]
+CLI_SECONDS = 10       # length of the signal of the command-line checks, in [s]
+CLI_CHUNK = 16384      # chunk size of the command-line checks
+REFERENCE_MAX = 10     # longest signal run through the reference loop, in [s]
+MEMORY_MAX = 10        # longest signal of the peak memory runs, in [s]
+ARRAY_SECONDS = 1      # length of each signal of the array runs, in [s]
+
+# AR(2) filter of the speech signal: resonance around 500 Hz at 8 kHz
+AR = (1.3, -0.6)
+
+def _ar_response(taps=128):
+
+    # Impulse response of the AR filter, truncated where it is negligible
+    h = [1.0, AR[0]]
+    for k in range(2, taps):
+        h.append(AR[0] * h[-1] + AR[1] * h[-2])
+    return np.array(h)
+
+def _segment(kind, sf, k):
+
+    # Second k of a test signal, as shorts; every second is generated from
+    # its own seed, so any part of a signal can be generated on its own
+    n = int(sf)
+    if kind == 'zeros':
+        return np.zeros(n, dtype=np.int16)
+    if kind == 'tone':
+        t = (k * n + np.arange(n)) / sf
+        return np.round(0.1 * 32767 * np.sin(2 * math.pi * 1000 * t)).astype(np.int16)
+
+    # The clipped signal is the speech one, amplified
+    rng = np.random.RandomState([1, n, k])
+
+    # Bursts of 50 to 800 ms and gaps of 20 to 600 ms, with levels spread
+    # over 30 dB; the last burst or gap is cut at the end of the second
+    gain = np.empty(n)
+    index = 0
+    active = rng.rand() < 0.6
+    while index < n:
+        if active:
+            length = int(sf * rng.uniform(0.05, 0.8))
+            gain[index:index+length] = 10 ** (rng.uniform(-40, -10) / 20)
+        else:
+            length = int(sf * rng.uniform(0.02, 0.6))
+            gain[index:index+length] = 10 ** (-70 / 20)
+        index += length
+        active = not active
+
+    x = np.convolve(rng.randn(n), _ar_response())[:n]
+    x *= gain / x.std()
+    if kind == 'clipped':
+        x *= 10
+    return np.round(np.clip(x * 32767, -32768, 32767)).astype(np.int16)
+
+def signal(kind, sf, seconds):
+
+    # Generator of the seconds of a test signal
+    for k in range(int(math.ceil(seconds))):
+        yield _segment(kind, sf, k)
+
+def signal_blocks(kind, sf, seconds, N):
+
+    # Generator of the blocks of N samples of a test signal
+    pending = np.zeros(0, dtype=np.int16)
+    for x in signal(kind, sf, seconds):
+        pending = np.concatenate([pending, x])
+        while len(pending) >= N:
+            yield pending[:N]
+            pending = pending[N:]
+    if len(pending):
+        yield pending
+
+def _blocks(x, N):
+    for index in range(0, len(x), N):
+        yield x[index:index+N]
+
+# ............................ ACCURACY CHECKS ............................
+
+def _run_reference(x, sf):
+    state = SVP56_state()
+    init_speech_voltmeter(state, sf)
+    for block in _blocks(x, GOLDEN_BLOCK):
+        sv56demo.measure(block, state, ENGINE_REFERENCE)
+    return state
+
+def _run_numpy(x, sf):
+    state = SVP56_state()
+    init_speech_voltmeter(state, sf)
+    for block in _blocks(sv56demo.pcm2fl(x, 16, True), GOLDEN_BLOCK):
+        speech_voltmeter_accumulate(block, state, ENGINE_NUMPY)
+    return state
+
+def _run_pcm(x, sf):
+    state = SVP56_state()
+    init_speech_voltmeter(state, sf)
+    for block in _blocks(x, GOLDEN_BLOCK):
+        speech_voltmeter_pcm_accumulate(block, state)
+    return state
+
+def _run_array(x, sf):
+    state = SVP56_array_state()
+    init_speech_voltmeter_array(state, sf, 2)
+    y = np.stack([sv56demo.pcm2fl(x, 16, True), np.zeros(len(x))])
+    for index in range(0, len(x), GOLDEN_BLOCK):
+        speech_voltmeter_array_accumulate(y[:, index:index+GOLDEN_BLOCK], state)
+    return state.channel(0)
+
+def _negated(x):
+
+    # -x of int16 data, with -32767 taken to -32768 (and one sample forced
+    # to it, for the signals that never peak), so that the array runs see
+    # the most negative value, whose magnitude int16 cannot hold
+    y = -x.astype(np.int32)
+    y[y == -32767] = -32768
+    if len(y):
+        y[len(y) // 2] = -32768
+    return y.astype(np.int16)
+
+def _array_pcm(x, sf):
+
+    # The signal and its negation as interleaved int16 channels, metered
+    # as sv56demo meters a multichannel file
+    state = SVP56_array_state()
+    init_speech_voltmeter_array(state, sf, 2)
+    y = np.stack([x, _negated(x)], axis=1).ravel()
+    for index in range(0, len(y), 2 * GOLDEN_BLOCK):
+        speech_voltmeter_array_accumulate(y[index:index+2*GOLDEN_BLOCK], state, interleaved=True)
+    return state
+
+def _run_array_pcm(x, sf):
+    return _array_pcm(x, sf).channel(0)
+
+def _channel_errors(x, sf):
+
+    # Each channel of the int16 array run against the same channel
+    # measured on its own with the integer PCM engine
+    state = _array_pcm(x, sf)
+    errors = []
+    for i, single in enumerate((x, _negated(x))):
+        ref = _run_pcm(single, sf)
+        res = state.channel(i)
+        if list(res.a) != list(ref.a) or (res.max, res.s, res.sq) != (ref.max, ref.s, ref.sq):
+            errors.append('channel %d' % i)
+    return errors
+
+def _run_shards(x, sf):
+    state = SVP56_state()
+    init_speech_voltmeter(state, sf)
+    x = sv56demo.pcm2fl(x, 16, True)
+    bounds = np.linspace(0, len(x), 4).astype(int)
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        shard = list(_blocks(x[start:stop], GOLDEN_BLOCK))
+        warmup = x[max(0, start - int(W * sf)):start]
+        speech_voltmeter_merge(state, speech_voltmeter_partial(shard, sf, warmup), shard)
+    return state
+
+def _index_errors(x, sf):
+
+    # The activity prefix index queried over the whole signal must match
+    # the measurement of the whole signal; empty ranges and ranges past
+    # the end must be rejected
+    index = speech_voltmeter_index(_blocks(sv56demo.pcm2fl(x, 16, True), GOLDEN_BLOCK), sf)
+    errors = []
+    if list(speech_voltmeter_index_query(index, 0, len(x)).a) != list(_run_numpy(x, sf).a):
+        errors.append('whole')
+    for name, start, end in (('past end', len(x), len(x) + 1000), ('empty', 1000, 1000),
+                             ('reversed', 1000, 500)):
+        try:
+            speech_voltmeter_index_query(index, start, end)
+        except ValueError:
+            continue
+        errors.append(name)
+    return errors
+
+CHECKS = (('reference', _run_reference), ('numpy', _run_numpy), ('pcm', _run_pcm),
+          ('array', _run_array), ('array-pcm', _run_array_pcm), ('shards', _run_shards))
+
+def _results(state):
+    return {'active_level_dB': state.SVP56_get_active_level(),
+            'activity': state.SVP56_get_activity(),
+            'rms_dB': state.SVP56_get_rms_dB(),
+            'a': list(state.a)}
+
+def accuracy(update=False, out=sys.stdout):
+
+    # Checks every way of measuring against the golden reference (or, with
+    # update, regenerates it with the reference loop); returns the number
+    # of failures
+    golden = {}
+    if not update:
+        with open(GOLDEN) as fid:
+            golden = json.load(fid)
+    checks = CHECKS[:1] if update else CHECKS
+
+    failures = 0
+    out.write("%-8s %6s %-10s %10s %9s %9s %s\n" %
+              ('signal', 'fs', 'engine', 'ActLev', '%Active', 'RMSLev', 'result'))
+    for kind in SIGNALS:
+        for sf in RATES:
+            name = '%s/%d' % (kind, sf)
+            x = np.concatenate(list(signal(kind, sf, GOLDEN_SECONDS)))
+            for engine, run in checks:
+                res = _results(run(x, sf))
+                if update:
+                    golden[name] = res
+                    verdict = 'updated'
+                else:
+                    ref = golden[name]
+                    errors = []
+                    if res['a'] != ref['a']:
+                        errors.append('counts')
+                    if abs(res['active_level_dB'] - ref['active_level_dB']) > LEVEL_TOL:
+                        errors.append('level')
+                    if abs(res['rms_dB'] - ref['rms_dB']) > LEVEL_TOL:
+                        errors.append('rms')
+                    if abs(res['activity'] - ref['activity']) > ACTIVITY_TOL:
+                        errors.append('activity')
+                    verdict = 'FAIL (%s)' % ', '.join(errors) if errors else 'ok'
+                    failures += bool(errors)
+                out.write("%-8s %6d %-10s %10.4f %9.4f %9.4f %s\n" %
+                          (kind, sf, engine, res['active_level_dB'], res['activity'],
+                           res['rms_dB'], verdict))
+            if not update:
+                for check, errors in (('channels', _channel_errors(x, sf)),
+                                      ('index', _index_errors(x, sf))):
+                    failures += bool(errors)
+                    out.write("%-8s %6d %-10s %10s %9s %9s %s\n" %
+                              (kind, sf, check, '', '', '',
+                               'FAIL (%s)' % ', '.join(errors) if errors else 'ok'))
+
+    if update:
+        with open(GOLDEN, 'w') as fid:
+            json.dump(golden, fid, indent=1, sort_keys=True)
+    return failures
+
+# ........................... COMMAND-LINE CHECKS ...........................
+
+def _sv56demo(*args, program=SV56DEMO):
+
+    # Runs sv56demo (or sv56pipe) in a process of its own; returns its exit
+    # value
+    return subprocess.call([sys.executable, program, '-q'] + list(args),
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def _inplace(options, program=SV56DEMO):
+
+    # Normalizing a file in place, with the given options (and program),
+    # must give the output of sv56demo in the default (in-memory) mode
+    def check(tmp, path):
+        ref = os.path.join(tmp, 'ref.raw')
+        if not os.path.exists(ref):
+            _sv56demo(path, ref)
+        work = os.path.join(tmp, 'inplace.raw')
+        shutil.copyfile(path, work)
+        errors = []
+        if _sv56demo(*(options + [work, work]), program=program) != 0:
+            errors.append('exit value')
+        with open(ref, 'rb') as fid1, open(work, 'rb') as fid2:
+            if fid1.read() != fid2.read():
+                errors.append('output')
+        if [name for name in os.listdir(tmp) if name.endswith('.tmp')]:
+            errors.append('temporary file left')
+        return errors
+    return check
+
+def _exit_values(tmp, path):
+
+    # sv56demo must end with the exit value documented for each case; the
+    # write error needs /dev/full
+    bad = os.path.join(tmp, 'bad.wav')
+    with open(bad, 'wb') as fid:
+        fid.write(b'RIFF\x04\x00\x00\x00WAVE')
+    out = os.path.join(tmp, 'out.raw')
+    cases = [(0, [path, out]),
+             (2, [os.path.join(tmp, 'missing.raw'), out]),
+             (2, ['-chunk', '0', path, out]),
+             (3, [path, os.path.join(tmp, 'missing', 'out.raw')]),
+             (3, ['-stream', path, os.path.join(tmp, 'missing', 'out.raw')]),
+             (4, ['-start', '100000', path, out]),
+             (4, ['-start', str(CLI_SECONDS * 16000 // 256 + 1), path, out]),
+             (5, [bad, out])]
+    if os.path.exists('/dev/full'):
+        cases += [(6, [path, '/dev/full']), (6, ['-stream', path, '/dev/full'])]
+    return ['%s for %s' % (status, ' '.join(os.path.basename(arg) for arg in args))
+            for status, args in cases if _sv56demo(*args) != status]
+
+def _checkpoint(tmp, path):
+
+    # A checkpoint resumes the range it was saved for, and only that one
+    checkpoint = os.path.join(tmp, 'speech.ckpt')
+    out = os.path.join(tmp, 'out.raw')
+    errors = []
+    if _sv56demo('-checkpoint', checkpoint, path, out) != 0:
+        errors.append('saving')
+    if _sv56demo('-checkpoint', checkpoint, path, out) != 0:
+        errors.append('resuming')
+    if _sv56demo('-checkpoint', checkpoint, '-start', '10', path, out) != 4:
+        errors.append('resuming another range')
+    return errors
+
+CLI_CHECKS = (('exit values', _exit_values),
+              ('checkpoint', _checkpoint),
+              ('in place -stream', _inplace(['-stream', '-chunk', str(CLI_CHUNK)])),
+              ('in place -jobs', _inplace(['-jobs', '2', '-chunk', str(CLI_CHUNK)])),
+              ('in place sv56pipe', _inplace(['-chunk', str(CLI_CHUNK)], SV56PIPE)))
+
+def cli(out=sys.stdout):
+
+    # Runs the command-line checks on a speech signal; returns the number
+    # of failures
+    failures = 0
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'speech.raw')
+        _write_signal(path, 16000, CLI_SECONDS)
+        for name, check in CLI_CHECKS:
+            errors = check(tmp, path)
+            failures += bool(errors)
+            out.write("%-27s %s\n" % (name, 'FAIL (%s)' % ', '.join(errors) if errors else 'ok'))
+    finally:
+        shutil.rmtree(tmp)
+    return failures
+
+# ............................... BENCHMARK ...............................
+
+def _timed(run, memory):
+
+    # Runs run(), which returns the time it took, in [s], and its number
+    # of calls; if memory, also returns the peak of the traced allocations
+    # of memory(), in bytes (the timing run is not traced)
+    elapsed, calls = run()
+    peak = None
+    if memory:
+        tracemalloc.start()
+        memory()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, calls, peak
+
+def _engine_run(engine, sf, seconds, N):
+
+    # Measures the speech signal with an engine, block by block; only the
+    # calls to the speech voltmeter are timed, not the signal generation
+    def run():
+        state = SVP56_state()
+        init_speech_voltmeter(state, sf)
+        elapsed = 0.0
+        calls = 0
+        for block in signal_blocks('speech', sf, seconds, N):
+            if engine != 'pcm':
+                block = sv56demo.pcm2fl(block, 16, True)
+                if engine == ENGINE_REFERENCE:
+                    block = block.tolist()
+            t0 = time.perf_counter()
+            if engine == 'pcm':
+                speech_voltmeter_pcm_accumulate(block, state)
+            else:
+                speech_voltmeter_accumulate(block, state, engine)
+            elapsed += time.perf_counter() - t0
+            calls += 1
+        t0 = time.perf_counter()
+        state.SVP56_get_active_level()
+        return elapsed + time.perf_counter() - t0, calls
+    return run
+
+def _array_run(sf, nsig, N, together):
+
+    # Measures nsig one-second speech signals (each second k of the speech
+    # signal is one of them), block by block: together, as the rows of an
+    # array state, or separately, one NumPy engine state each
+    x = np.stack([sv56demo.pcm2fl(_segment('speech', sf, k), 16, True)
+                  for k in range(nsig)])
+    def run():
+        if together:
+            state = SVP56_array_state()
+            init_speech_voltmeter_array(state, sf, nsig)
+        else:
+            states = [SVP56_state() for k in range(nsig)]
+            for state in states:
+                init_speech_voltmeter(state, sf)
+        calls = 0
+        t0 = time.perf_counter()
+        for index in range(0, x.shape[1], N):
+            if together:
+                speech_voltmeter_array_accumulate(x[:, index:index+N], state)
+            else:
+                for k, state in enumerate(states):
+                    speech_voltmeter_accumulate(x[k, index:index+N], state, ENGINE_NUMPY)
+            calls += 1
+        if together:
+            speech_voltmeter_array_finalize(state)
+        else:
+            for state in states:
+                state.SVP56_get_active_level()
+        return time.perf_counter() - t0, calls
+    return run
+
+def _write_signal(path, sf, seconds):
+    with open(path, 'wb') as fid:
+        for x in signal('speech', sf, seconds):
+            x.tofile(fid)
+
+def _stages(path, sf, N):
+
+    # The stages of sv56demo on the file at path, as runs for _timed(); the
+    # measuring and equalizing stages are timed without the reading
+    out = path + '.out'
+    fmt = pcm_format(path)
+
+    def read():
+        t0 = time.perf_counter()
+        read_pcm(path, fmt)
+        return time.perf_counter() - t0, 1
+
+    def measure():
+        Fi = read_pcm(path, fmt)[:, 0]
+        state = SVP56_state()
+        init_speech_voltmeter(state, sf)
+        t0 = time.perf_counter()
+        for block in _blocks(Fi, N):
+            sv56demo.measure(block, state)
+        return time.perf_counter() - t0, -(-len(Fi) // N)
+
+    def equalize():
+        Fi = read_pcm(path, fmt)
+        Fo = [create_pcm(out, fmt, len(Fi))]
+        t0 = time.perf_counter()
+        sv56demo.equalize_targets(Fi, Fo, [0.5])
+        del Fo
+        return time.perf_counter() - t0, -(-len(Fi) // sv56demo.CHUNK)
+
+    def normalize():
+        t0 = time.perf_counter()
+        sv56demo.normalize_file(path, out, N=N, sf=sf)
+        return time.perf_counter() - t0, 1
+
+    def stream():
+        t0 = time.perf_counter()
+        sv56demo.normalize_file(path, out, N=N, sf=sf, stream=True)
+        return time.perf_counter() - t0, 1
+
+    return (('read', read), ('measure', measure), ('equalize', equalize),
+            ('normalize', normalize), ('stream', stream))
+
+def benchmark(rates, durations, blocks, out=sys.stdout):
+
+    # Speed, latency and peak memory of the engines and of the stages of
+    # sv56demo; returns the results as a list of dicts
+    results = []
+    out.write("%-12s %6s %7s %6s %12s %12s %10s\n" %
+              ('run', 'fs', 'secs', 'block', 'samples/s', 'us/call', 'peak MB'))
+
+    def report(name, sf, seconds, N, elapsed, calls, peak, nsig=1):
+        smpno = nsig * int(sf) * int(math.ceil(seconds))
+        res = {'run': name, 'sampling_rate': sf, 'seconds': seconds, 'block': N,
+               'time': elapsed, 'samples_per_s': smpno / elapsed,
+               'latency_us': 1e6 * elapsed / max(calls, 1),
+               'peak_bytes': peak}
+        results.append(res)
+        out.write("%-12s %6d %7g %6d %12.0f %12.1f %10s\n" %
+                  (name, sf, seconds, N, res['samples_per_s'], res['latency_us'],
+                   '-' if peak is None else '%.1f' % (peak / 1e6)))
+        out.flush()
+
+    for sf in rates:
+        for seconds in durations:
+            for N in blocks:
+                for engine in (ENGINE_REFERENCE, ENGINE_NUMPY, 'pcm'):
+                    if engine == ENGINE_REFERENCE and seconds > REFERENCE_MAX:
+                        continue
+                    memory = None
+                    if seconds <= MEMORY_MAX or engine != ENGINE_REFERENCE:
+                        memory = _engine_run(engine, sf, min(seconds, MEMORY_MAX), N)
+                    report(engine, sf, seconds, N,
+                           *_timed(_engine_run(engine, sf, seconds, N), memory))
+
+            # sv56demo stages, with its default block size
+            fd, path = tempfile.mkstemp(suffix='.raw')
+            os.close(fd)
+            try:
+                _write_signal(path, sf, seconds)
+                for name, run in _stages(path, sf, 256):
+                    report(name, sf, seconds, 256, *_timed(run, run))
+            finally:
+                for temp in (path, path + '.out'):
+                    if os.path.exists(temp):
+                        os.unlink(temp)
+
+        # Signals measured together as an array, and one at a time
+        for nsig in ARRAY_SIGNALS:
+            for N in blocks:
+                for together, name in ((True, 'array/%d'), (False, 'separate/%d')):
+                    report(name % nsig, sf, ARRAY_SECONDS, N,
+                           *_timed(_array_run(sf, nsig, N, together), None), nsig=nsig)
+    return results
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='sv56bench', add_help=True)
+    parser.add_argument('-update', action='store_true',
+                        help='regenerate the golden reference')
+    parser.add_argument('-noaccuracy', action='store_true',
+                        help='skip the accuracy and command-line checks')
+    parser.add_argument('-nobench', action='store_true', help='skip the benchmark')
+    parser.add_argument('-rates', default=','.join(map(str, RATES)),
+                        help='sampling rates of the benchmark')
+    parser.add_argument('-durations', default=','.join(map(str, DURATIONS)),
+                        help='durations of the benchmark, in s')
+    parser.add_argument('-long', action='store_true', help='add 600 s and 3600 s')
+    parser.add_argument('-blocks', default=','.join(map(str, BLOCKS)),
+                        help='block sizes of the benchmark')
+    parser.add_argument('-json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    report = {}
+    failures = 0
+    if args.update:
+        accuracy(update=True)
+    elif not args.noaccuracy:
+        failures = accuracy() + cli()
+        report['accuracy_failures'] = failures
+
+    if not args.nobench:
+        durations = [float(d) for d in args.durations.split(',')]
+        if args.long:
+            durations += LONG_DURATIONS
+        report['benchmark'] = benchmark([float(r) for r in args.rates.split(',')],
+                                        durations,
+                                        [int(n) for n in args.blocks.split(',')])
+
+    if args.json:
+        with open(args.json, 'w') as fid:
+            json.dump(report, fid, indent=1)
+    sys.exit(1 if failures else 0)
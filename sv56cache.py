@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#  ============================================================================
+#
+#  SV56CACHE.PY
+#  ~~~~~~~~~~~~
+#
+#  Description:
+#  ~~~~~~~~~~~~
+#
+#  On-disk cache of speech voltmeter measurements, so that a file already
+#  measured is equalized again (e.g. to another level) with a single
+#  scaling pass. Entries hold the whole SVP56_state after the measurement,
+#  keyed by the SHA-256 of the file contents and the measurement
+#  parameters (sampling rate, resolution, block range and engine); a copy
+#  or a renamed file hits the same entry. The hash of a file is itself
+#  remembered by device, inode, size and modification time, so an
+#  unchanged file is not read to be looked up.
+#
+#  The cache is an SQLite database in the cache directory, which may be
+#  shared by concurrent processes. It keeps at most `size' entries,
+#  evicting the least recently used ones, and counts hits and misses.
+#
+#  Usage:
+#  ~~~~~~
+#  $ sv56cache dir ....... prints the entries, hits and misses of the cache
+#  $ sv56cache -clear dir  empties the cache
+#
+#  ============================================================================
+
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+
+# Default number of entries kept in the cache
+CACHE_SIZE = 4096
+
+# Name of the database in the cache directory
+CACHE_DB = 'sv56cache.sqlite'
+
+# Bytes hashed at a time
+HASH_CHUNK = 1 << 20
+
+# Fields of SVP56_state kept in the cache
+STATE_FIELDS = ('f', 'a', 'c', 'hang', 'n', 's', 'sq', 'p', 'q', 'max',
+                'refdB', 'maxP', 'maxN', 'offset')
+
+def file_digest(FileIn):
+
+    # SHA-256 of the contents of a file
+    h = hashlib.sha256()
+    with open(FileIn, 'rb') as fid:
+        for data in iter(lambda: fid.read(HASH_CHUNK), b''):
+            h.update(data)
+    return h.hexdigest()
+
+class SV56Cache(object):
+
+    def __init__(self, path, size=CACHE_SIZE):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.size = size    # (unsigned long) max. number of entries
+        self.hits = 0       # (unsigned long) hits of this instance
+        self.misses = 0     # (unsigned long) misses of this instance
+        self.db = sqlite3.connect(os.path.join(path, CACHE_DB), timeout=60,
+                                  isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS files '
+                            '(id TEXT PRIMARY KEY, digest TEXT)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                            '(key TEXT PRIMARY KEY, state TEXT, used REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS results_used '
+                            'ON results (used)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS counters '
+                            '(name TEXT PRIMARY KEY, value INTEGER)')
+            self.db.execute("INSERT OR IGNORE INTO counters VALUES "
+                            "('hits', 0), ('misses', 0)")
+
+    def __repr__(self):
+        return "<SV56Cache '%s' : '%s'>" % (self.path, self.size)
+
+    def close(self):
+        self.db.close()
+
+    def digest(self, FileIn):
+
+        # Content hash of a file, from the files table if the file has not
+        # changed since it was last hashed
+        st = os.stat(FileIn)
+        fid = '%d:%d:%d:%d' % (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        row = self.db.execute('SELECT digest FROM files WHERE id = ?', (fid,)).fetchone()
+        if row:
+            return row[0]
+        digest = file_digest(FileIn)
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?)', (fid, digest))
+        return digest
+
+    def key(self, FileIn, **params):
+
+        # Entry key of the measurement of a file with the given parameters
+        return json.dumps([self.digest(FileIn), sorted(params.items())])
+
+    def _count(self, name):
+        self.db.execute('UPDATE counters SET value = value + 1 WHERE name = ?', (name,))
+
+    def lookup(self, key, state):
+
+        # Loads the state of a cached measurement into `state'; returns
+        # False on a miss
+        with self.db:
+            row = self.db.execute('SELECT state FROM results WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                self._count('misses')
+                return False
+            self.db.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+            self.hits += 1
+            self._count('hits')
+        for name, value in json.loads(row[0]).items():
+            setattr(state, name, value)
+        state.stale = state.n > 0
+        return True
+
+    def store(self, key, state):
+
+        # Caches the state of a measurement, evicting the least recently
+        # used entries beyond the size of the cache
+        value = json.dumps({name: getattr(state, name) for name in STATE_FIELDS})
+        with self.db:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                            (key, value, time.time()))
+            self.db.execute('DELETE FROM results WHERE key NOT IN '
+                            '(SELECT key FROM results ORDER BY used DESC LIMIT ?)',
+                            (self.size,))
+            self.db.execute('DELETE FROM files WHERE digest NOT IN '
+                            '(SELECT DISTINCT json_extract(key, \'$[0]\') FROM results)')
+
+    def counters(self):
+
+        # Number of entries, and hits and misses of all the users of the cache
+        counters = dict(self.db.execute('SELECT name, value FROM counters'))
+        counters['entries'] = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return counters
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM results')
+            self.db.execute('DELETE FROM files')
+            self.db.execute('UPDATE counters SET value = 0')
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='sv56cache', add_help=True)
+    parser.add_argument('dir', help='the cache directory')
+    parser.add_argument('-clear', action='store_true', help='empty the cache')
+    args = parser.parse_args()
+
+    cache = SV56Cache(args.dir)
+    if args.clear:
+        cache.clear()
+    counters = cache.counters()
+    sys.stdout.write("entries: %d hits: %d misses: %d\n" %
+                     (counters['entries'], counters['hits'], counters['misses']))
+    cache.close()
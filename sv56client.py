@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#  ============================================================================
+#
+#  SV56CLIENT.PY
+#  ~~~~~~~~~~~~~
+#
+#  Description:
+#  ~~~~~~~~~~~~
+#
+#  Thin client of the measurement server (sv56server.py): sends its command
+#  line, which is the same as that of sv56demo, to the server over a local
+#  Unix socket, and prints the statistics the server answers with. Only
+#  the standard library is imported, so the start-up cost is that of the
+#  interpreter alone; NumPy and the speech voltmeter stay loaded in the
+#  server.
+#
+#  Usage:
+#  ~~~~~~
+#  $ sv56client [-socket path] [sv56demo options] FileIn FileOut [...]
+#  where:
+#  path             is the server socket [default: $SV56_SOCKET, or
+#                   /tmp/sv56.sock]
+#  FileIn           as for sv56demo, or `-' to stream the input PCM data
+#                   from stdin to the server
+#  FileOut          as for sv56demo, or `-' to have the server stream the
+#                   normalized PCM data back to stdout; the statistics are
+#                   then printed to stderr
+#
+#  Relative paths are taken from the client's working directory. The exit
+#  value is that of sv56demo.
+#
+#  Protocol:
+#  ~~~~~~~~~
+#  Each message is a 4-byte big-endian length, a JSON header of that
+#  length and, if the header has a `size', that many bytes of data. Data
+#  streams are sent as messages with data, ended by one with `size' 0.
+#
+#  > client: {"argv": [...], "cwd": "..."}
+#  < server, if FileIn is `-': {"input": true}
+#  > client: the input stream
+#  < server: {"status": n, "stdout": "...", "stderr": "...", "output": bool}
+#  < server, if "output": the output stream
+#
+#  ============================================================================
+
+import os
+import sys
+import json
+import socket
+import struct
+
+# Default socket of the measurement server
+DEFAULT_SOCKET = '/tmp/sv56.sock'
+
+# Bytes per message of a data stream
+STREAM_CHUNK = 1 << 20
+
+HEADER = struct.Struct('>I')
+
+def _recv_exact(fid, size):
+
+    # Reads exactly size bytes from a socket file
+    data = fid.read(size)
+    if len(data) < size:
+        raise EOFError("connection closed")
+    return data
+
+def send_message(fid, header, data=b''):
+
+    # Sends a JSON header and its data
+    if data:
+        header = dict(header, size=len(data))
+    raw = json.dumps(header).encode('utf-8')
+    fid.write(HEADER.pack(len(raw)) + raw + data)
+    fid.flush()
+
+def recv_message(fid):
+
+    # Receives a JSON header and its data
+    size, = HEADER.unpack(_recv_exact(fid, HEADER.size))
+    header = json.loads(_recv_exact(fid, size).decode('utf-8'))
+    return header, _recv_exact(fid, header.get('size', 0))
+
+def send_stream(fid, src):
+
+    # Sends the contents of the binary file src as a data stream
+    while True:
+        data = src.read(STREAM_CHUNK)
+        send_message(fid, {}, data)
+        if not data:
+            return
+
+def recv_stream(fid, dst):
+
+    # Receives a data stream into the binary file dst
+    while True:
+        header, data = recv_message(fid)
+        if not data:
+            return
+        dst.write(data)
+
+def request(path, argv, stdin=None, stdout=None):
+
+    # Runs sv56demo with the command line argv in the server at path;
+    # stdin and stdout are the binary files the PCM data of FileIn and
+    # FileOut `-' are streamed from and to. Returns the server reply.
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        with sock.makefile('rwb') as fid:
+            send_message(fid, {'argv': list(argv), 'cwd': os.getcwd()})
+            reply, data = recv_message(fid)
+            if reply.get('input'):
+                send_stream(fid, stdin)
+                reply, data = recv_message(fid)
+            if reply.get('output'):
+                recv_stream(fid, stdout)
+                stdout.flush()
+    return reply
+
+def main(argv):
+
+    # The socket option is the client's own; everything else goes to the
+    # server as is
+    path = os.environ.get('SV56_SOCKET', DEFAULT_SOCKET)
+    if len(argv) >= 2 and argv[0] == '-socket':
+        path, argv = argv[1], argv[2:]
+
+    try:
+        reply = request(path, argv)
+    except (OSError, EOFError) as e:
+        sys.stderr.write("sv56client: cannot reach server at %s: %s\n" % (path, e))
+        return 2
+    sys.stdout.write(reply.get('stdout', ''))
+    sys.stderr.write(reply.get('stderr', ''))
+    return reply.get('status', 1)
+
+if __name__ == '__main__':
+
+    sys.exit(main(sys.argv[1:]))
@@ -35,7 +35,20 @@
 #  is done by function `fl2sh()', using: truncation, no
 #  zero-padding of the least significant bits, left-justification
 #  of data, hard-clipping of data outside the range -32768..+32767.
-#  After that, data is saved to file.
+#  After that, data is saved to file. Here, with the NumPy engine,
+#  the shorts are measured as they are (see speech_voltmeter_pcm())
+#  and only converted to float for the equalization. The gain, clipping (to
+#  the range of the resolution given, left-justified) and truncation
+#  are done in place, one chunk at a time, straight into the memory-
+#  mapped output file, counting the samples saturated.
+#
+#  Besides headerless 16-bit files, FileIn may be a WAV file of 16, 24
+#  or 32-bit PCM data, mono or multichannel (see sv56wav.py); its sampling
+#  rate and resolution are then taken from the header, the blocks are
+#  counted in frames, and the outputs are WAV files of the same format,
+#  written in one pass. Each channel is measured on its own; all are
+#  equalized by the factor of the channel with the highest level, whose
+#  statistics are printed.
 #
 #  The default values for the AD,DA systems resolution is 16
 #  bits, for the sampling rate is 16000 Hz. To change this
@@ -84,6 +97,56 @@
 #  -end eb ........ define `eb' as the last block to be measured
 #  -n nb .......... define `nb' as the number of blocks to be measured; 
 #                   equivalent to parameter N2 above [default: whole file]
+#                   Only the blocks to be measured are read from FileIn,
+#                   and only they are written, equalized, to FileOut.
+#  -engine e ...... sample loop used by the speech voltmeter: `numpy'
+#                   (vectorized) or `reference' (per-sample, as in the C
+#                   module) [default: numpy]
+#  -stream ........ two-pass streaming mode: the input file is read and
+#                   measured, then read again and equalized, `chunk'
+#                   samples at a time, the outputs being written in order,
+#                   so memory use does not grow with the file size.
+#  -chunk n ....... number of samples per chunk in streaming mode
+#                   [default: 262144]
+#  -jobs n ........ measures the file in `n' worker processes, one shard of
+#                   the memory-mapped file each; results are the same as
+#                   with a single process. Implies streaming equalization.
+#                   With -batch, the number of files processed in parallel.
+#                   [default: 1]
+#  -batch report .. batch mode: FileIn is a directory (searched recursively),
+#                   a glob pattern, a single file or a manifest (one input
+#                   path per line), named `*.txt' or `*.lst' or given as
+#                   `@manifest', and FileOut is the output directory, where the outputs
+#                   keep the inputs' relative paths; the statistics of every
+#                   file are written to `report', as CSV or, if its name
+#                   ends in .jsonl, as JSON lines. A bad input file is
+#                   reported and skipped.
+#  -target lev file  also writes `file', equalized to the active speech level
+#                   `lev' in dBov; may be repeated. The input is measured
+#                   once and all the outputs are written in a single pass.
+#  -rmstarget lev file  same as -target, for the RMS long-term level.
+#  -checkpoint file  saves the speech voltmeter states (one per channel) to
+#                   `file' after measuring; if `file' exists, measuring
+#                   resumes from the states in it, so that only the data
+#                   appended to FileIn since are measured. The statistics
+#                   are those of the whole range, which must start at the
+#                   same block as when `file' was saved.
+#  -cache dir ..... keeps the measurements in a cache in directory `dir',
+#                   keyed by the file contents and the sampling rate,
+#                   resolution, block range and engine; a file measured
+#                   before with the same parameters (e.g. to be equalized
+#                   to another level) is only equalized. See sv56cache.py.
+#  -cachesize n ... number of measurements kept in the cache, the least
+#                   recently used ones being evicted [default: 4096]
+#  -profile file .. writes to `file', as JSON, the time spent, calls and
+#                   samples and bytes processed in each stage (`read',
+#                   `convert' to float, `meter' (the sample loop),
+#                   `statistics', `scale', `write' and `flush' of the
+#                   outputs to their files), the bin_interp iterations and
+#                   tolerance relaxations, and the peak resident memory. In
+#                   streaming mode the file is read one chunk at a time, in
+#                   `read'. With -jobs, the stages of the workers are added
+#                   in, so their times are summed over the workers.
 #
 #  Modules used:
 #  ~~~~~~~~~~~~~
@@ -100,7 +163,7 @@
 #  ~~~~~~~~~~~~
 #  0      success (all but VMS);
 #  1      success (only in VMS);
-#  2      error opening input file;
+#  2      error opening input file, or invalid command line (e.g. -chunk 0);
 #  3      error creating output file;
 #  4      error moving pointer to desired start of conversion;
 #  5      error reading input file;
@@ -163,83 +226,818 @@
 #*/
 
 import os
+import sys
+import csv
+import glob
+import json
 import math
+import time
+import shutil
 import argparse
-from ctypes import sizeof, c_short
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 import numpy as np
 
-from svp56 import SVP56_state, bin_interp, init_speech_voltmeter, speech_voltmeter
+from svp56 import SVP56_state, init_speech_voltmeter
+from svp56 import speech_voltmeter_accumulate, speech_voltmeter_pcm_accumulate
+from svp56 import speech_voltmeter_partial, speech_voltmeter_merge, W
+from svp56 import SVP56_array_state, init_speech_voltmeter_array_from
+from svp56 import speech_voltmeter_array_accumulate
+from svp56 import ENGINES, ENGINE_NUMPY
+from svp56 import speech_voltmeter_state_save, speech_voltmeter_state_load
+from svp56 import SVP56_profile, speech_voltmeter_profile
+from svp56 import speech_voltmeter_profile_stage, speech_voltmeter_profile_report
+from svp56 import speech_voltmeter_profile_installed, speech_voltmeter_profile_merge
+from sv56cache import SV56Cache, CACHE_SIZE
+from sv56wav import pcm_format, map_pcm, read_pcm, create_pcm, stream_pcm, empty_pcm, flush_pcm
+from sv56wav import PCMFile, PCMStream
 
-if __name__ == '__main__':
+# Samples per chunk in streaming mode
+CHUNK = 262144
 
-    parser = argparse.ArgumentParser(prog='sv56demo', add_help=True)
-    parser.add_argument('FileIn', help='the input file to be analysed and equalized')
-    parser.add_argument('FileOut', help='the output equalized file')
-    
-    args = parser.parse_args()
+# Longest chunk, in frames, whose channels are measured together: beyond,
+# the array pass is measured to be no faster than one channel at a time
+ARRAY_FRAMES = 16384
 
-    # Parameters for operation 
-    N=256
-    N1=0
-    N2=0
-    NdB=-26 # dBov
+class SV56Error(Exception):
 
-    #  Intermediate storage variables for speech voltmeter
-    state = SVP56_state()
+    # An error ending the demo program with the exit value `status' (see
+    # Exit values above)
+    def __init__(self, message, status):
+        Exception.__init__(self, message)
+        self.status = status
 
-    # Other variables
-    quiet=0
-    use_active_level = 1
-    long_summary = 1
-    NrSat = 0
-    start_byte = 0
-    bitno = 16
-    sf = 16000
-    factor = 0.0
-    ActiveLeveldB = None
-    DesiredSpeechLeveldB = None
+class SV56RangeError(SV56Error, ValueError):
 
-    # ......... SOME INITIALIZATIONS .........
-    start_byte = N1
-    start_byte *= N * sizeof(c_short)
+    # The block range to be measured starts at or beyond the end of the
+    # file, so that there is nothing to measure
+    def __init__(self, message):
+        SV56Error.__init__(self, message, 4)
+
+def sh2fl(Fi):
+
+    # Conversion from short to float, normalized to the range -1..+1
+    return Fi.astype(np.float32) / np.iinfo(np.int16).max
+
+def pcm2fl(Fi, bits=16, double=False):
+
+    # Conversion from PCM of `bits' bits to float, normalized to the range
+    # -1..+1; in double precision above 16 bits, or if double (as the data
+    # to be measured, whose sums are accumulated in double precision)
+    t0 = time.perf_counter()
+    if bits == 16 and not double:
+        x = sh2fl(Fi)
+    else:
+        x = np.asarray(Fi, dtype=np.float64) / ((1 << (bits - 1)) - 1)
+    speech_voltmeter_profile_stage('convert', t0, x.size, x.nbytes)
+    return x
+
+def equalize(Fi, factor, Fo, bitno=16, bits=16):
+
+    # Equalizes normalized data in place and de-normalizes it into the PCM
+    # buffer Fo of `bits' bits, with truncation and hard clipping of data
+    # outside the range of a bitno-bit system (left-justified, as the rest
+    # of the file); returns the number of samples saturated
+    t0 = time.perf_counter()
+    step = 1 << (bits - bitno)
+    Overflow = 1 << (bitno - 1)
+    Fi *= factor
+    Fi *= (1 << (bits - 1)) - 1
+    NrSat = int(np.count_nonzero(Fi < -Overflow * step))
+    NrSat += int(np.count_nonzero(Fi > (Overflow - 1) * step))
+    np.clip(Fi, -Overflow * step, (Overflow - 1) * step, out=Fi)
+    speech_voltmeter_profile_stage('scale', t0, Fi.size, Fi.nbytes)
+    t0 = time.perf_counter()
+    Fo[...] = Fi
+    speech_voltmeter_profile_stage('write', t0, Fi.size, Fi.size * bits // 8)
+    return NrSat
+
+def measure(Fi, state, engine=ENGINE_NUMPY, bits=16):
+
+    # Feeds PCM data to the speech voltmeter; the NumPy engine measures
+    # them as they are, the reference loop needs them normalized, as
+    # Python floats (double precision, and fast to index)
+    if engine == ENGINE_NUMPY:
+        speech_voltmeter_pcm_accumulate(Fi, state, bits)
+    else:
+        speech_voltmeter_accumulate(pcm2fl(Fi, bits, True).tolist(), state, engine)
+
+def measure_frames(Fi, states, engine=ENGINE_NUMPY, bits=16):
+
+    # Feeds a (frames, channels) chunk of PCM data to the speech voltmeter
+    # of each channel; with the NumPy engine, the channels of short chunks
+    # of multichannel data are measured together, in one vectorized pass
+    if engine == ENGINE_NUMPY and len(states) > 1 and len(Fi) <= ARRAY_FRAMES:
+        array = SVP56_array_state()
+        init_speech_voltmeter_array_from(array, states)
+        speech_voltmeter_array_accumulate(Fi, array, True, bits)
+        states[:] = [array.channel(ch) for ch in range(len(states))]
+    else:
+        for ch, state in enumerate(states):
+            measure(Fi[:, ch], state, engine, bits)
+
+def map_input(FileIn, start=0, smpno=None):
+
+    # Memory-maps smpno frames (by default, up to the end of the file) of a
+    # headerless 16-bit or WAV file from frame `start' on, as a (frames,
+    # channels) array; no data is read until used
+    return map_pcm(FileIn, pcm_format(FileIn), start, smpno)
+
+def open_input(FileIn, start=0, smpno=None):
+
+    # Same as map_input(), the data being read a chunk at a time as they
+    # are sliced (see PCMFile), so that memory use does not grow with the
+    # file size
+    return PCMFile(FileIn, pcm_format(FileIn), start, smpno)
+
+def read_chunk(Fi, index, chunk):
+
+    # Frames index..index+chunk-1 of the memory-mapped (or PCMFile) data
+    # Fi, read into memory: the file is read here, in the `read' stage,
+    # rather than within the stage that first uses the data
+    t0 = time.perf_counter()
+    x = np.array(Fi[index:index+chunk])
+    speech_voltmeter_profile_stage('read', t0, x.size, x.nbytes)
+    return x
+
+def output_path(FileIn, FileOut):
+
+    # Path to write FileOut to: FileOut itself or, if it is FileIn (that is
+    # still to be read while the output is written), a temporary file in
+    # the same directory, to be renamed over it by replace_output()
+    if not (os.path.exists(FileOut) and os.path.samefile(FileIn, FileOut)):
+        return FileOut
+    fd, path = tempfile.mkstemp(prefix='.sv56', suffix='.tmp',
+                                dir=os.path.dirname(os.path.abspath(FileOut)))
+    os.close(fd)
+    shutil.copymode(FileOut, path)
+    return path
+
+def replace_output(path, FileOut, done=True):
+
+    # Renames the temporary file of output_path() over FileOut once it is
+    # written (done), or removes it
+    if path == FileOut:
+        return
+    if done:
+        os.replace(path, FileOut)
+    elif os.path.exists(path):
+        os.unlink(path)
+
+def progress(i, quiet):
+
+    # Progress flag, printed unless in quiet operation
+    if not quiet:
+        sys.stderr.write("%c\r" % "|/-\\|/-\\"[i % 8])
+
+def measure_stream(FileIn, states, chunk=CHUNK, engine=ENGINE_NUMPY,
+                   start=0, smpno=None, quiet=1, bits=16):
+
+    # Pass one: feeds the speech voltmeter of each channel one chunk of the
+    # file at a time
+    Fi = open_input(FileIn, start, smpno)
+    for i, index in enumerate(range(0, len(Fi), chunk)):
+        progress(i, quiet)
+        measure_frames(read_chunk(Fi, index, chunk), states, engine, bits)
+    del Fi
+
+def equalize_targets(Fi, Fo, factors, chunk=CHUNK, bitno=16, bits=16, mapped=False):
+
+    # Equalizes the PCM data Fi into each of the mapped outputs Fo with its
+    # own factor, in one pass: each chunk is converted to float once, and
+    # copied for all but the last output; returns the samples saturated per
+    # output. Outputs that are not mapped (PCMStream) get each chunk
+    # through a buffer, written in order. If Fi is mapped (or a PCMFile),
+    # each chunk is read from it first.
+    NrSat = [0] * len(Fo)
+    work = None
+    buf = None
+    for index in range(0, len(Fi), chunk):
+        x = pcm2fl(read_chunk(Fi, index, chunk) if mapped else Fi[index:index+chunk], bits)
+        if work is None:
+            work = np.empty_like(x)
+        for t in range(len(Fo)):
+            if t < len(Fo) - 1:
+                np.copyto(work[:len(x)], x)
+                y = work[:len(x)]
+            else:
+                y = x
+            if isinstance(Fo[t], PCMStream):
+                if buf is None:
+                    buf = empty_pcm(Fo[t].fmt, len(x))
+                NrSat[t] += equalize(y, factors[t], buf[:len(x)], bitno, bits)
+                t0 = time.perf_counter()
+                try:
+                    Fo[t].write(buf[:len(x)])
+                except OSError as e:
+                    raise SV56Error("error writing to file: %s" % e.strerror, 6)
+                speech_voltmeter_profile_stage('write', t0)
+            else:
+                NrSat[t] += equalize(y, factors[t], Fo[t][index:index+chunk], bitno, bits)
+    return NrSat
+
+def _chunks(Fi, start, stop, chunk, bits=16):
+
+    # Normalized chunks (in double precision) of the samples start..stop-1
+    # of a mapped channel
+    for index in range(start, stop, chunk):
+        yield pcm2fl(read_chunk(Fi, index, min(chunk, stop - index)), bits, True)
+
+def measure_shard(FileIn, start, stop, sf, chunk=CHUNK, first=0, smpno=None,
+                  ch=0, bits=16, origin=None, profile=False):
+
+    # Runs in a worker process: measures samples start..stop-1 of channel ch
+    # of the mapped range into a partial state, warming the envelope up on
+    # the W seconds before. The warm-up may reach back before the range, to
+    # the frame `origin' of the file at which measuring began (when resuming
+    # from a checkpoint), but not before it: the envelope starts from zero
+    # there. Returns the partial state and, if profile, the stage records
+    # of the worker (else None).
+    if origin is None:
+        origin = first
+    previous = speech_voltmeter_profile(SVP56_profile() if profile else None)
+    try:
+        lo = max(origin, first + start - int(W * sf))
+        Fi = map_input(FileIn, lo, first + stop - lo)[:, ch]
+        warmup = pcm2fl(read_chunk(Fi, 0, first + start - lo), bits, True)
+        partial = speech_voltmeter_partial(_chunks(Fi, first + start - lo, len(Fi),
+                                                   chunk, bits), sf, warmup)
+        stages = speech_voltmeter_profile_installed().stages if profile else None
+    finally:
+        speech_voltmeter_profile(previous)
+    return partial, stages
+
+def measure_parallel(FileIn, states, jobs, chunk=CHUNK, first=0, smpno=None, bits=16,
+                     origin=None):
+
+    # Splits each channel in one shard per job (at least one chunk long),
+    # measures the shards in a process pool and merges them in order. A
+    # shard whose envelope estimate turns out wrong is measured again here,
+    # so the counts are always those of a sequential measurement. The
+    # stages profiled in the workers are merged into the profile installed.
+    Fi = map_input(FileIn, first, smpno)
+    smpno = len(Fi)
+    shard = max(chunk, math.ceil(smpno / jobs))
+    profile = speech_voltmeter_profile_installed() is not None
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [(ch, start, pool.submit(measure_shard, FileIn, start,
+                                           min(start+shard, smpno), state.f,
+                                           chunk, first, smpno, ch, bits, origin,
+                                           profile))
+                   for ch, state in enumerate(states)
+                   for start in range(0, smpno, shard)]
+        for ch, start, future in futures:
+            partial, stages = future.result()
+            if stages:
+                speech_voltmeter_profile_merge(stages)
+            speech_voltmeter_merge(states[ch], partial,
+                                   _chunks(Fi[:, ch], start, min(start+shard, smpno),
+                                           chunk, bits))
+    del Fi
+
+def block_range(FileIn, fmt, N=256, N1=0, N2=0):
+
+    # First frame and number of frames of N2 blocks of N frames (by
+    # default, up to the end of the file) from block N1 (counted from 0)
+    # on, and the number of blocks
+    start = N1
+    start *= N
+    if start >= fmt.frames:
+        raise SV56RangeError("block %d is beyond the end of %s" % (N1 + 1, FileIn))
 
     # Check if is to process the whole file
     if N2 == 0:
-        st = os.stat(args.FileIn)
-        N2 = math.ceil((st.st_size - start_byte) / (N * sizeof(c_short)))
-    
-    # Overflow (saturation) point
-    Overflow = math.pow(2.0, (bitno-1))
-
-    init_speech_voltmeter(state, sf)
-    print(state)
-    # Opening input file
-    Fi = None
-    with open(args.FileIn, 'rb') as fid:
-        Fi = np.fromfile(fid, dtype=np.int16)
-        Fi = Fi.astype(np.float32) / np.iinfo(np.int16).max
-
-    index = 0
-    for i in range(0, N2):
-        index = i * N
+        N2 = math.ceil((fmt.frames - start) / N)
+    return start, min(N2 * N, fmt.frames - start), N2
 
-        ActiveLeveldB = speech_voltmeter(Fi[index:min(index+N, len(Fi))], state)
+def equalization_factor(states, NdB, use_active_level=1):
 
-    # ... COMPUTE EQUALIZATION FACTOR ... 
+    # Factor equalizing the channel of highest active speech level (or RMS
+    # level) to NdB, and that channel
     DesiredSpeechLeveldB = float( NdB )
     if use_active_level:
+        state = max(states, key=SVP56_state.SVP56_get_active_level)
+        ActiveLeveldB = state.SVP56_get_active_level()
         factor = math.pow(10.0, (DesiredSpeechLeveldB-ActiveLeveldB) / 20.0)
     else:
-        factor = math.pow(10.0, (DesiredSpeechLeveldB-SVP56_get_rms_dB(state)) / 20.0)
+        state = max(states, key=SVP56_state.SVP56_get_rms_dB)
+        factor = math.pow(10.0, (DesiredSpeechLeveldB-state.SVP56_get_rms_dB()) / 20.0)
+    return factor, states.index(state)
+
+def normalize_file(FileIn, FileOut, N=256, N1=0, N2=0, NdB=-26, sf=16000,
+                   bitno=16, use_active_level=1, engine=ENGINE_NUMPY,
+                   stream=False, chunk=CHUNK, jobs=1, quiet=1, cache=None,
+                   cache_size=CACHE_SIZE):
+
+    # Measures and equalizes N2 blocks of N samples (by default, up to the
+    # end of the file) from block N1 (counted from 0) on; with a cache
+    # directory, a measurement already cached is not done again
+    return normalize_file_targets(FileIn, [(FileOut, NdB, use_active_level)],
+                                  N, N1, N2, sf, bitno, engine, stream, chunk,
+                                  jobs, quiet, cache, cache_size)[0]
+
+def normalize_file_targets(FileIn, targets, N=256, N1=0, N2=0, sf=16000,
+                           bitno=16, engine=ENGINE_NUMPY, stream=False,
+                           chunk=CHUNK, jobs=1, quiet=1, cache=None,
+                           cache_size=CACHE_SIZE, checkpoint=None):
+
+    # Same as normalize_file() for several targets (FileOut, NdB,
+    # use_active_level): the file is measured once and all the outputs are
+    # written in one more pass; returns the statistics of each target. The
+    # sampling rate and resolution of WAV files are those of their header;
+    # the outputs are in the format of the input. Each channel is measured
+    # on its own, and all are equalized by the same factor, that of the
+    # channel with the highest level. With a checkpoint file, measuring
+    # resumes from the states saved in it (if any), and they are saved back.
+
+    # Other variables
+    NrSat = None
+    start = 0
+    factors = []
+
+    # ......... SOME INITIALIZATIONS .........
+    try:
+        fmt = pcm_format(FileIn)
+    except OSError as e:
+        raise SV56Error("cannot open %s: %s" % (FileIn, e.strerror), 2)
+    except ValueError as e:
+        raise SV56Error(str(e), 5)
+    if fmt.wav:
+        sf, bitno = fmt.sf, fmt.bits
+    start, smpno, N2 = block_range(FileIn, fmt, N, N1, N2)
+
+    #  Intermediate storage variables for speech voltmeter, one per channel
+    states = [SVP56_state() for ch in range(fmt.channels)]
+    for state in states:
+        init_speech_voltmeter(state, sf)
+        state.offset = start
+
+    # Opening input file; only the blocks of interest are read
+    Fi = None
+    if not (stream or jobs > 1):
+        t0 = time.perf_counter()
+        try:
+            Fi = read_pcm(FileIn, fmt, start, smpno)
+        except OSError as e:
+            raise SV56Error("error reading %s: %s" % (FileIn, e.strerror), 5)
+        speech_voltmeter_profile_stage('read', t0, smpno * fmt.channels,
+                                       smpno * fmt.block_align)
+
+    # Look for the measurements in the cache
+    hit = False
+    if cache is not None:
+        cache = SV56Cache(cache, cache_size)
+        keys = [cache.key(FileIn, sf=sf, bitno=bitno, N=N, N1=N1, N2=N2,
+                          engine=engine, channel=ch) for ch in range(fmt.channels)]
+
+        # Cached states are only used if all the channels hit; a channel
+        # hit alone would be measured again on top of its cached state
+        cached = [SVP56_state() for key in keys]
+        hit = all([cache.lookup(key, state) for key, state in zip(keys, cached)])
+        if hit:
+            states = cached
+
+    # Resume from the checkpoint: only the data after it are measured
+    resume = 0
+    if checkpoint is not None and not hit and os.path.exists(checkpoint):
+        # The states must have been measured from the start of the range:
+        # the samples they hold are those just before their offset
+        states = speech_voltmeter_state_load(checkpoint)
+        resume = states[0].offset - start
+        if states[0].offset - states[0].n != start:
+            raise SV56Error("checkpoint %s was measured from sample %d, not from sample %d "
+                            "(block %d)" % (checkpoint, states[0].offset - states[0].n,
+                                            start, N1 + 1), 4)
+        if (len(states) != fmt.channels or states[0].f != sf or
+                not 0 <= resume <= smpno):
+            raise SV56Error("checkpoint %s does not match %s" % (checkpoint, FileIn), 4)
+
+    # Streaming mode: two passes over the file, a chunk at a time
+    if hit:
+        pass
+    elif jobs > 1:
+        measure_parallel(FileIn, states, jobs, chunk, start + resume,
+                         smpno - resume, fmt.bits, start)
+    elif stream:
+        measure_stream(FileIn, states, chunk, engine, start + resume,
+                       smpno - resume, quiet, fmt.bits)
+    else:
+        # The counts do not depend on how the data are split, so the blocks
+        # of interest are measured a chunk at a time rather than block by
+        # block; N only selects the range
+        for i, index in enumerate(range(resume, len(Fi), chunk)):
+            progress(i, quiet)
+            measure_frames(Fi[index:index+chunk], states, engine, fmt.bits)
+
+    if checkpoint is not None:
+        speech_voltmeter_state_save(states, checkpoint)
+
+    if cache is not None:
+        if not hit:
+            for key, state in zip(keys, states):
+                cache.store(key, state)
+        cache.close()
+
+    # ... COMPUTE EQUALIZATION FACTORS ... 
+    refs = []
+    for FileOut, NdB, use_active_level in targets:
+        factor, ch = equalization_factor(states, NdB, use_active_level)
+        factors.append(factor)
+        refs.append(ch)
 
     #
     # EQUALIZATION: hard clipping (with truncation)
     #
 
     #  Get data of interest, equalize and de-normalize
-    Fo = Fi * factor
-    Fo = (Fo * np.iinfo(np.int16).max).astype(np.int16)
-    with open(args.FileOut, 'wb') as fid:
-        Fo.tofile(fid)
+    # In streaming mode, the input is read and the outputs written a chunk
+    # at a time. An output that is the input itself, still to be read, is
+    # written to a temporary file, renamed over the input at the end.
+    if stream or jobs > 1:
+        Fi = open_input(FileIn, start, smpno)
+    frames = len(Fi)
+    paths = []
+    done = False
+    try:
+        create = stream_pcm if stream or jobs > 1 else create_pcm
+        Fo = []
+        for FileOut, NdB, use_active_level in targets:
+            try:
+                paths.append(output_path(FileIn, FileOut) if stream or jobs > 1 else FileOut)
+                Fo.append(create(paths[-1], fmt, frames))
+            except OSError as e:
+                raise SV56Error("cannot create %s: %s" % (FileOut, e.strerror), 3)
+        NrSat = equalize_targets(Fi, Fo, factors, chunk, bitno, fmt.bits, stream or jobs > 1)
+
+        # The outputs are closed; when profiling, the maps are also flushed,
+        # so that writing them back to the files is recorded as `flush'
+        t0 = time.perf_counter()
+        for out in Fo:
+            try:
+                if isinstance(out, PCMStream):
+                    out.close()
+                elif speech_voltmeter_profile_installed() is not None:
+                    flush_pcm(out)
+            except OSError as e:
+                raise SV56Error("error writing to file: %s" % e.strerror, 6)
+        del Fi, Fo
+        speech_voltmeter_profile_stage('flush', t0, len(targets) * frames * fmt.channels,
+                                       len(targets) * frames * fmt.block_align)
+        done = True
+    finally:
+        for path, target in zip(paths, targets):
+            replace_output(path, target[0], done)
+
+    result = []
+    for (FileOut, NdB, use_active_level), factor, sat, ch in zip(targets, factors, NrSat, refs):
+        stats = summary_statistics(FileIn, states[ch], factor, sat, bitno, fmt.bits)
+        stats.update({'output': FileOut, 'channels': fmt.channels, 'channel': ch + 1,
+                      'block_size': N, 'first_block': N1 + 1, 'blocks': N2,
+                      'desired_level_dB': float(NdB),
+                      'use_active_level': use_active_level})
+        if cache is not None:
+            stats['cache'] = 'hit' if hit else 'miss'
+        result.append(stats)
+    return result
+
+def summary_statistics(FileIn, state, factor, NrSat, bitno=16, bits=16):
+
+    # The statistics printed in the summaries of the C demo program, with
+    # values in PCM units (of `bits' bits) rather than normalized
+    full = (1 << (bits - 1)) - 1
+    ActiveLeveldB = state.SVP56_get_active_level()
+    if state.SVP56_get_smpno() > 0:
+        maxP, maxN = state.SVP56_get_pos_max(), state.SVP56_get_neg_max()
+    else:
+        maxP = maxN = 0.0
+    abs_max_dB = 20 * math.log10(state.SVP56_get_abs_max() + 0.0000001) - state.refdB
+    return {
+        'file': FileIn,
+        'samples': state.SVP56_get_smpno(),
+        'sampling_rate': float(state.f),
+        'bits': bitno,
+        'dc_level': state.SVP56_get_DC_level() * full,
+        'max_pos': maxP * full,
+        'max_neg': maxN * full,
+        'rms_dB': state.SVP56_get_rms_dB(),
+        'active_level_dB': ActiveLeveldB,
+        'rms_peak_factor_dB': abs_max_dB - state.SVP56_get_rms_dB(),
+        'active_peak_factor_dB': abs_max_dB - ActiveLeveldB,
+        'activity': state.SVP56_get_activity(),
+        'factor': factor,
+        'saturated': NrSat,
+    }
+
+def print_p56_long_summary(out, stats):
+
+    # Long summary, as printed by the C demo program
+    unity = 'dBov'
+    if stats['use_active_level']:
+        level, what = stats['active_level_dB'], 'Active speech level'
+    else:
+        level, what = stats['rms_dB'], 'RMS level'
+    abs_max_dB = stats['active_peak_factor_dB'] + stats['active_level_dB']
+    out.write("\n---------------------------")
+    out.write("----------------------------")
+    out.write("\n  Input file: ................... %s, " % stats['file'])
+    out.write("%2d bits, fs=%5.0f Hz" % (stats['bits'], stats['sampling_rate']))
+    if stats['channels'] > 1:
+        out.write("\n  Channels: ..................... %7d (statistics of channel %d)" %
+                  (stats['channels'], stats['channel']))
+    out.write("\n  Block Length: ................. %7d [samples]" % stats['block_size'])
+    out.write("\n  Starting Block: ............... %7d []" % stats['first_block'])
+    out.write("\n  Number of Blocks: ............. %7d []" % stats['blocks'])
+    out.write("\n  %s desired for output: %s %7.3f [%s]" %
+              (what, '.' * (27 - len(what)), stats['desired_level_dB'], unity))
+
+    # Skip if no activity in file
+    if stats['active_level_dB'] == -100 and stats['use_active_level']:
+        out.write("\n  Input file has no speech activity (all 0's or silence)")
+        out.write("\n---------------------------")
+        out.write("----------------------------\n")
+        return
+
+    out.write("\n  Norm factor desired is: ....... %7.3f [times]" % stats['factor'])
+    out.write("\n  Max norm WITHOUT saturation: .. %7.3f [%s]" % (level - abs_max_dB, unity))
+    out.write("\n  DC level: ..................... %7.0f [PCM]" % stats['dc_level'])
+    out.write("\n  Maximum positive value: ....... %7.0f [PCM]" % stats['max_pos'])
+    out.write("\n  Maximum negative value: ....... %7.0f [PCM]" % stats['max_neg'])
+    out.write("\n  Long term energy (rms): ....... %7.3f [%s]" % (stats['rms_dB'], unity))
+    out.write("\n  Active speech level: .......... %7.3f [%s]" % (stats['active_level_dB'], unity))
+    out.write("\n  RMS peak-factor found: ........ %7.3f [dB]" % stats['rms_peak_factor_dB'])
+    out.write("\n  Active peak factor found: ..... %7.3f [dB]" % stats['active_peak_factor_dB'])
+    out.write("\n  Activity factor: .............. %7.3f [%%]" % stats['activity'])
+    out.write("\n  Samples saturated: ............ %7d []" % stats['saturated'])
+    out.write("\n---------------------------")
+    out.write("----------------------------\n")
+
+def print_p56_short_summary(out, stats):
+
+    # One-line summary, as printed by the C demo program with -qq
+    out.write("%s: " % stats['file'])
+    out.write("Samples: %5d " % stats['samples'])
+    out.write("Min: %5.0f " % stats['max_neg'])
+    out.write("Max: %5.0f " % stats['max_pos'])
+    out.write("DC: %7.2f " % stats['dc_level'])
+    out.write("RMSLev[dB]: %7.3f " % stats['rms_dB'])
+    out.write("ActLev[dB]: %7.3f " % stats['active_level_dB'])
+    out.write("%%Active: %7.3f " % stats['activity'])
+    out.write("RMSPkF[dB]: %7.3f " % stats['rms_peak_factor_dB'])
+    out.write("ActPkF[dB]: %7.3f\n" % stats['active_peak_factor_dB'])
+
+# Columns of the batch report
+REPORT_FIELDS = ['file', 'output', 'samples', 'sampling_rate', 'bits',
+                 'channels', 'channel',
+                 'block_size', 'first_block', 'blocks', 'desired_level_dB',
+                 'use_active_level', 'dc_level', 'max_pos', 'max_neg', 'rms_dB', 'active_level_dB',
+                 'rms_peak_factor_dB', 'active_peak_factor_dB', 'activity',
+                 'factor', 'saturated', 'cache', 'error']
+
+# Extensions of the batch manifests, besides those given as @manifest
+MANIFEST_EXT = ('.txt', '.lst')
+
+def batch_inputs(source):
+
+    # Input files of a batch: the files in a directory and its
+    # subdirectories, the files matching a glob pattern, a single file, or
+    # the paths listed one per line in a manifest file, named *.txt or *.lst
+    # or given as @manifest (relative paths are taken from the manifest's
+    # directory)
+    if os.path.isdir(source):
+        return sorted(os.path.join(path, name)
+                      for path, dirs, names in os.walk(source) for name in names)
+    manifest = source[1:] if source.startswith('@') else source
+    if os.path.isfile(manifest) and (manifest != source or
+                                     os.path.splitext(manifest)[1].lower() in MANIFEST_EXT):
+        base = os.path.dirname(manifest)
+        with open(manifest) as fid:
+            lines = [line.strip() for line in fid]
+        return [os.path.join(base, line) for line in lines
+                if line and not line.startswith('#')]
+    if os.path.isfile(source):
+        return [source]
+    return sorted(name for name in glob.glob(source, recursive=True)
+                  if os.path.isfile(name))
+
+def batch_files(source, OutDir):
+
+    # (FileIn, FileOut) of each input of a batch, FileOut being in OutDir
+    # at the path of FileIn relative to the inputs' common directory
+    inputs = batch_inputs(source)
+    if not inputs:
+        return []
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(name)) for name in inputs])
+    return [(FileIn, os.path.join(OutDir, os.path.relpath(os.path.abspath(FileIn), root)))
+            for FileIn in inputs]
+
+def report_writer(fid, report):
+
+    # Function writing a row to the batch report open in fid: CSV or, if
+    # its name ends in .jsonl, JSON lines
+    if report.endswith('.jsonl'):
+        return lambda row: fid.write(json.dumps(row) + '\n')
+    writer = csv.DictWriter(fid, REPORT_FIELDS, restval='')
+    writer.writeheader()
+    return writer.writerow
+
+def _batch_file(FileIn, FileOut, kwargs):
+
+    # Runs in a worker process; a bad input is reported, not raised
+    try:
+        os.makedirs(os.path.dirname(FileOut) or '.', exist_ok=True)
+        row = normalize_file(FileIn, FileOut, **kwargs)
+    except Exception as e:
+        row = {'file': FileIn, 'error': '%s: %s' % (type(e).__name__, e)}
+    row['output'] = FileOut
+    return row
+
+def normalize_batch(source, OutDir, report, jobs=1, **kwargs):
+
+    # Normalizes every input of the batch into OutDir, keeping the paths
+    # relative to the inputs' common directory, with `jobs' worker
+    # processes and at most 2*jobs files in flight; one row per file is
+    # written to the CSV (or, for a .jsonl name, JSON lines) report as the
+    # files complete. Returns the number of files that failed.
+    files = batch_files(source, OutDir)
+    if not files:
+        return 0
+
+    errors = 0
+    with open(report, 'w', newline='') as fid, ProcessPoolExecutor(jobs) as pool:
+        write_row = report_writer(fid, report)
+        pending = set()
+        queue = iter(files)
+        while True:
+            for FileIn, FileOut in queue:
+                pending.add(pool.submit(_batch_file, FileIn, FileOut, kwargs))
+                if len(pending) >= 2 * jobs:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                row = future.result()
+                errors += 'error' in row
+                write_row(row)
+    return errors
+
+def build_parser():
+
+    # Command line of the demo program, shared with the measurement server
+    parser = argparse.ArgumentParser(prog='sv56demo', add_help=True)
+    parser.add_argument('FileIn', help='the input file to be analysed and equalized')
+    parser.add_argument('FileOut', help='the output equalized file')
+    parser.add_argument('BlockSize', type=int, nargs='?',
+                        help='the block size in number of samples')
+    parser.add_argument('FirstBlock', type=int, nargs='?',
+                        help='the first block to be analysed/equalized')
+    parser.add_argument('NoOfBlocks', type=int, nargs='?',
+                        help='number of blocks to be analysed/equalized')
+    parser.add_argument('DesiredLevel', type=float, nargs='?',
+                        help='level desired to the output file, in dBov')
+    parser.add_argument('SampleRate', type=float, nargs='?',
+                        help='sampling rate of the file, in Hz')
+    parser.add_argument('Resolution', type=int, nargs='?',
+                        help='the digital system resolution, in number of bits')
+    parser.add_argument('-bits', type=int, default=16,
+                        help='word length, in bits [default: 16]')
+    parser.add_argument('-lev', type=float, default=-26,
+                        help='level desired to the output file, in dBov [default: -26]')
+    parser.add_argument('-log', help='print the statistics log into file rather than stdout')
+    parser.add_argument('-q', action='store_true',
+                        help='quiet operation: does not print the progress flag')
+    parser.add_argument('-qq', action='store_true',
+                        help='print short statistics summary; no progress flag')
+    parser.add_argument('-rms', action='store_true',
+                        help='normalize using the RMS long-term level instead of the active level')
+    parser.add_argument('-sf', type=float, default=16000,
+                        help='sampling frequency, in Hz [default: 16000]')
+    parser.add_argument('-blk', type=int, default=256,
+                        help='block size, in samples [default: 256]')
+    parser.add_argument('-start', type=int, default=1,
+                        help='first block to be measured [default: 1]')
+    parser.add_argument('-end', type=int, help='last block to be measured')
+    parser.add_argument('-n', type=int, help='number of blocks to be measured')
+    parser.add_argument('-engine', choices=ENGINES, default=ENGINE_NUMPY,
+                        help='sample loop used by the speech voltmeter')
+    parser.add_argument('-stream', action='store_true',
+                        help='measure and equalize in two passes, a chunk at a time')
+    parser.add_argument('-chunk', type=int, default=CHUNK,
+                        help='number of samples per chunk in streaming mode')
+    parser.add_argument('-jobs', type=int, default=1,
+                        help='number of worker processes measuring the file')
+    parser.add_argument('-batch', metavar='REPORT',
+                        help='normalize a directory, glob or manifest of files '
+                             'into the directory FileOut, writing a CSV/JSONL report')
+    parser.add_argument('-target', nargs=2, action='append', default=[],
+                        metavar=('LEV', 'FILE'),
+                        help='also write FILE with active level LEV, in dBov')
+    parser.add_argument('-rmstarget', nargs=2, action='append', default=[],
+                        metavar=('LEV', 'FILE'),
+                        help='also write FILE with RMS level LEV, in dBov')
+    parser.add_argument('-checkpoint', metavar='FILE',
+                        help='resume measuring from the states in FILE, and save them back')
+    parser.add_argument('-cache', metavar='DIR',
+                        help='directory of the cache of measurements')
+    parser.add_argument('-cachesize', type=int, default=CACHE_SIZE,
+                        help='number of measurements kept in the cache')
+    parser.add_argument('-profile', metavar='FILE',
+                        help='write the time spent in each stage to FILE, as JSON')
+    return parser
+
+def command_params(args, parser):
+
+    # Parameters for operation; the positional parameters, if given,
+    # override the options
+    N = args.blk if args.BlockSize is None else args.BlockSize
+    N1 = (args.start if args.FirstBlock is None else args.FirstBlock) - 1
+    N2 = 0
+    if args.end is not None:
+        N2 = args.end - N1
+    if args.n is not None:
+        N2 = args.n
+    if args.NoOfBlocks is not None:
+        N2 = args.NoOfBlocks
+    NdB = args.lev if args.DesiredLevel is None else args.DesiredLevel
+    sf = args.sf if args.SampleRate is None else args.SampleRate
+    bitno = args.bits if args.Resolution is None else args.Resolution
+    if N < 1 or N1 < 0 or N2 < 0:
+        parser.error('invalid block size or block range')
+    if not 1 <= bitno <= 16:
+        parser.error('resolution must be between 1 and 16 bits')
+    if args.chunk < 1:
+        parser.error('chunk size must be positive')
+    use_active_level = 0 if args.rms else 1
+    return dict(N=N, N1=N1, N2=N2, NdB=NdB, sf=sf, bitno=bitno,
+                use_active_level=use_active_level, engine=args.engine,
+                stream=args.stream, chunk=args.chunk, cache=args.cache,
+                cache_size=args.cachesize, checkpoint=args.checkpoint)
+
+def main(args, parser=None):
+
+    # Runs the demo program for parsed command-line arguments; returns the
+    # exit value
+    parser = parser or build_parser()
+    params = command_params(args, parser)
+    NdB, use_active_level = params['NdB'], params['use_active_level']
+
+    # Other variables
+    quiet = args.q or args.qq
+    long_summary = 0 if args.qq else 1
+
+    # Outputs: FileOut, and the -target and -rmstarget files
+    targets = [(args.FileOut, NdB, use_active_level)]
+    try:
+        targets += [(FileOut, float(lev), 1) for lev, FileOut in args.target]
+        targets += [(FileOut, float(lev), 0) for lev, FileOut in args.rmstarget]
+    except ValueError:
+        parser.error('target levels must be numbers, in dBov')
+
+    # Batch mode: one file per worker process
+    if args.batch:
+        if len(targets) > 1:
+            parser.error('-target and -rmstarget cannot be used with -batch')
+        if args.checkpoint:
+            parser.error('-checkpoint cannot be used with -batch')
+        if args.profile:
+            parser.error('-profile cannot be used with -batch')
+        del params['checkpoint']
+        errors = normalize_batch(args.FileIn, args.FileOut, args.batch, args.jobs, **params)
+        return 5 if errors else 0
+
+    del params['NdB'], params['use_active_level']
+    profile = SVP56_profile() if args.profile else None
+    previous = speech_voltmeter_profile(profile)
+    try:
+        result = normalize_file_targets(args.FileIn, targets, jobs=args.jobs,
+                                        quiet=quiet, **params)
+    except SV56Error as e:
+        sys.stderr.write("sv56demo: %s\n" % e)
+        return e.status
+    finally:
+        speech_voltmeter_profile(previous)
+
+    # ... PRINT-OUT OF RESULTS ...
+    try:
+        out = open(args.log, 'w') if args.log else sys.stdout
+    except OSError as e:
+        sys.stderr.write("sv56demo: cannot create %s: %s\n" % (args.log, e.strerror))
+        return 3
+    if long_summary:
+        for stats in result:
+            print_p56_long_summary(out, stats)
+    else:
+        print_p56_short_summary(out, result[0])
+    if args.log:
+        out.close()
+
+    if profile is not None:
+        with open(args.profile, 'w') as fid:
+            json.dump(speech_voltmeter_profile_report(profile), fid, indent=1)
+    return 0
+
+if __name__ == '__main__':
 
+    parser = build_parser()
+    sys.exit(main(parser.parse_args(), parser))
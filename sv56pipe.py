@@ -0,0 +1,522 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#  ============================================================================
+#
+#  SV56PIPE.PY
+#  ~~~~~~~~~~~
+#
+#  Description:
+#  ~~~~~~~~~~~~
+#
+#  Pipelined normalization of a file, or of a batch of files, as by
+#  sv56demo: the work is cut into chunks that flow through three stages,
+#  each run by its own pool of threads,
+#
+#  read ........... reads the chunks of the files, to be measured (first
+#                   pass) and, once a file is measured, to be equalized
+#                   (second pass); the next files are read ahead
+#  meter .......... measures the chunks of the first pass, in order for
+#                   each file, and equalizes those of the second pass
+#  write .......... writes the equalized chunks to the output files
+#
+#  so that the disks and the cores are kept busy at the same time. The
+#  stages are linked by queues of at most `buffers' chunks: a stage ahead
+#  of the next one waits (backpressure), and the memory used is bounded by
+#  the number of chunks in flight, not by the file sizes. The outputs are
+#  those of sv56demo, and so are the statistics, but for the rounding of
+#  the sums (e.g. of the DC level) when the chunks are not of BlockSize.
+#
+#  The occupancy of each queue (mean and peak number of chunks, fraction
+#  of the time it was empty, i.e. the stage was starved, or full, i.e. the
+#  stages before it were held back) and, for the threads of each stage,
+#  the fraction of the time spent working (utilization) and that spent
+#  blocked, waiting for room in the queue of the next stage or, in the
+#  meter stage, for the previous chunk of the file, are reported, to size
+#  the pipeline.
+#
+#  The threads overlap I/O with metering; the metering of several files
+#  overlaps only as far as NumPy releases the interpreter lock. For CPU-
+#  bound batches on local disks, sv56demo -batch with -jobs, which uses
+#  processes, may be faster.
+#
+#  Usage:
+#  ~~~~~~
+#  $ sv56pipe [-options] FileIn FileOut [BlockSize [1stBlock [NoOfBlocks
+#             [DesiredLevel [SampleRate [Resolution] ] ] ] ] ]
+#  where the parameters and options are those of sv56demo, but for:
+#  -jobs n ........ number of meter threads [default: 1]
+#  -batch report .. as for sv56demo; the files are pipelined together
+#  -readers n ..... number of reader threads [default: 2]
+#  -writers n ..... number of writer threads [default: 2]
+#  -buffers n ..... chunks queued before each stage [default: 8]
+#  -files n ....... files in flight at a time [default: 4]
+#  -occupancy file  writes the occupancy, utilization and blocked time of
+#                   each stage to `file', as JSON
+#  -stream, -target, -rmstarget, -checkpoint, -cache and -profile are not
+#  available.
+#
+#  ============================================================================
+
+import os
+import sys
+import json
+import time
+import queue
+import threading
+
+from svp56 import SVP56_state, init_speech_voltmeter
+import sv56demo
+from sv56wav import pcm_format, read_pcm, create_pcm_file, empty_pcm, pcm_bytes
+
+# Default numbers of threads of the reader and writer stages
+READERS = 2
+WRITERS = 2
+
+# Default number of chunks queued before each stage
+BUFFERS = 8
+
+# Default number of files in flight
+FILES = 4
+
+class SV56Queue(queue.Queue):
+
+    # Queue keeping the time integral of its length, and the time it has
+    # been empty and full; updated (under the queue lock) on every change
+    def __init__(self, maxsize=0):
+        queue.Queue.__init__(self, maxsize)
+        self.t0 = self.t = time.perf_counter()
+        self.area = 0.0     # (double) integral of the length, in [chunks*s]
+        self.empty = 0.0    # (double) time spent empty, in [s]
+        self.full = 0.0     # (double) time spent full, in [s]
+        self.peak = 0       # (unsigned long) max. length
+        self.items = 0      # (unsigned long) items queued
+
+    def _tick(self):
+        now = time.perf_counter()
+        n = len(self.queue)
+        self.area += n * (now - self.t)
+        if n == 0:
+            self.empty += now - self.t
+        elif 0 < self.maxsize <= n:
+            self.full += now - self.t
+        self.t = now
+
+    def _put(self, item):
+        self._tick()
+        queue.Queue._put(self, item)
+        if item is not None:
+            self.items += 1
+        self.peak = max(self.peak, len(self.queue))
+
+    def _get(self):
+        self._tick()
+        return queue.Queue._get(self)
+
+    def occupancy(self):
+        with self.mutex:
+            self._tick()
+            elapsed = max(self.t - self.t0, 1e-12)
+            return {'buffers': self.maxsize or None, 'items': self.items,
+                    'mean': self.area / elapsed, 'peak': self.peak,
+                    'empty': self.empty / elapsed, 'full': self.full / elapsed}
+
+class SV56Stage(object):
+
+    def __init__(self, name, func, threads, maxsize):
+        self.name = name    # (str) name of the stage
+        self.func = func    # (callable) called with each item of the queue
+        self.threads = [None] * threads  # threads running the stage
+        self.queue = SV56Queue(maxsize)  # items waiting for the stage
+        self.busy = 0.0     # (double) time spent working in func, all threads, in [s]
+        self.blocked = 0.0  # (double) time spent blocked in func, all threads, in [s]
+
+    def __repr__(self):
+        return "<SV56Stage '%s' : '%s'>" % (self.name, len(self.threads))
+
+class SV56Pipeline(object):
+
+    # Stages run by pools of threads, fed through queues of at most
+    # `buffers' items (or unbounded); a stage function passes items on by
+    # put(). Exceptions of the stage functions are raised by join().
+    def __init__(self, buffers=BUFFERS):
+        self.buffers = buffers
+        self.stages = {}
+        self.pending = 0    # (unsigned long) items put and not yet processed
+        self.cond = threading.Condition()
+        self.error = None
+        self.t0 = None
+        self.local = threading.local()  # blocked time of the current item
+
+    def __repr__(self):
+        return "<SV56Pipeline '%s' : '%s'>" % (self.buffers, list(self.stages))
+
+    def stage(self, name, func, threads=1, bounded=True):
+        self.stages[name] = SV56Stage(name, func, threads, self.buffers if bounded else 0)
+
+    def put(self, name, item):
+
+        # Queues an item for a stage, waiting while its queue is full
+        with self.cond:
+            self.pending += 1
+        t0 = time.perf_counter()
+        self.stages[name].queue.put(item)
+        self._blocked(t0)
+
+    def wait(self, cond, predicate):
+
+        # Waits on a condition (held) until predicate() is true; the time
+        # is counted as blocked, not as work, of the stage
+        t0 = time.perf_counter()
+        cond.wait_for(predicate)
+        self._blocked(t0)
+
+    def _blocked(self, t0):
+        if hasattr(self.local, 'blocked'):
+            self.local.blocked += time.perf_counter() - t0
+
+    def _run(self, stage):
+        while True:
+            item = stage.queue.get()
+            if item is None:
+                return
+            t0 = time.perf_counter()
+            self.local.blocked = 0.0
+            try:
+                stage.func(item)
+            except BaseException as e:
+                with self.cond:
+                    self.error = self.error or e
+            with self.cond:
+                stage.busy += time.perf_counter() - t0 - self.local.blocked
+                stage.blocked += self.local.blocked
+                self.pending -= 1
+                if self.pending == 0:
+                    self.cond.notify_all()
+
+    def start(self):
+        self.t0 = time.perf_counter()
+        for stage in self.stages.values():
+            for i in range(len(stage.threads)):
+                stage.threads[i] = threading.Thread(target=self._run, args=(stage,),
+                                                    name='%s-%d' % (stage.name, i),
+                                                    daemon=True)
+                stage.threads[i].start()
+
+    def join(self):
+
+        # Waits until all the items are processed, and stops the threads
+        with self.cond:
+            while self.pending:
+                self.cond.wait()
+        for stage in self.stages.values():
+            for thread in stage.threads:
+                stage.queue.put(None)
+            for thread in stage.threads:
+                thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def occupancy(self):
+
+        # Occupancy of the queue of each stage, and the fractions of the
+        # time its threads were working (utilization) and blocked
+        elapsed = max(time.perf_counter() - self.t0, 1e-12)
+        result = {}
+        for name, stage in self.stages.items():
+            result[name] = stage.queue.occupancy()
+            result[name]['threads'] = len(stage.threads)
+            result[name]['utilization'] = stage.busy / (len(stage.threads) * elapsed)
+            result[name]['blocked'] = stage.blocked / (len(stage.threads) * elapsed)
+        return result
+
+class SV56Job(object):
+
+    # One file going through the pipeline
+    def __init__(self, FileIn, FileOut, params):
+        self.FileIn = FileIn
+        self.FileOut = FileOut
+        self.params = params  # (dict) parameters of sv56demo.normalize_file()
+        self.fmt = None     # (SV56Format) format of FileIn
+        self.out = None     # (SV56Format) format of FileOut
+        self.path = None    # (str) path FileOut is written to (see sv56demo.output_path())
+        self.fd = None      # (int) descriptor of FileOut
+        self.start = 0      # (unsigned long) first frame to be measured
+        self.smpno = 0      # (unsigned long) number of frames to be measured
+        self.blocks = 0     # (unsigned long) number of blocks
+        self.sf = 0.0       # (float) sampling frequency, in Hz
+        self.bitno = 16     # (unsigned long) resolution, in bits
+        self.states = []    # (SVP56_state) speech voltmeter of each channel
+        self.factor = 1.0   # (double) equalization factor
+        self.ref = 0        # (unsigned long) channel the factor is that of
+        self.NrSat = 0      # (unsigned long) samples saturated
+        self.chunks = 0     # (unsigned long) chunks of the current pass
+        self.done = 0       # (unsigned long) chunks of the pass processed
+        self.error = None   # (str) error, if the file failed
+        self.cond = threading.Condition()
+
+    def __repr__(self):
+        return "<SV56Job '%s' : '%s'>" % (self.FileIn, self.FileOut)
+
+class SV56Normalizer(object):
+
+    # The stages of the pipelined normalization of files; `finish' is
+    # called with the statistics of each file (or its error) once done
+    def __init__(self, finish, readers=READERS, jobs=1, writers=WRITERS,
+                 buffers=BUFFERS, files=FILES):
+        self.finish = finish
+        self.slots = threading.BoundedSemaphore(files)
+        self.pipeline = SV56Pipeline(buffers)
+        self.pipeline.stage('read', self.read, readers, bounded=False)
+        self.pipeline.stage('meter', self.meter, jobs)
+        self.pipeline.stage('write', self.write, writers)
+
+    def __repr__(self):
+        return "<SV56Normalizer '%s'>" % self.pipeline
+
+    def run(self, files, **params):
+
+        # Normalizes the (FileIn, FileOut) files, at most `files' at a time;
+        # returns the occupancy of the stages
+        self.pipeline.start()
+        for FileIn, FileOut in files:
+            self.slots.acquire()
+            self.pipeline.put('read', (SV56Job(FileIn, FileOut, params), 1))
+        self.pipeline.join()
+        return self.pipeline.occupancy()
+
+    def _fail(self, job, e):
+        job.error = job.error or '%s: %s' % (type(e).__name__, e)
+
+    def _open(self, job):
+
+        # ......... SOME INITIALIZATIONS .........
+        params = job.params
+        job.fmt = pcm_format(job.FileIn)
+        job.sf, job.bitno = params['sf'], params['bitno']
+        if job.fmt.wav:
+            job.sf, job.bitno = job.fmt.sf, job.fmt.bits
+        job.start, job.smpno, job.blocks = sv56demo.block_range(
+            job.FileIn, job.fmt, params['N'], params['N1'], params['N2'])
+        job.states = [SVP56_state() for ch in range(job.fmt.channels)]
+        for state in job.states:
+            init_speech_voltmeter(state, job.sf)
+            state.offset = job.start
+
+    def read(self, item):
+
+        # Reads the chunks of a pass over a file, in order; the chunks not
+        # read after an error are taken as done
+        job, npass = item
+        chunk = job.params['chunk']
+        index = 0
+        try:
+            if npass == 1:
+                self._open(job)
+            # The number of chunks is only known (to the stages after)
+            # once they are all read
+            with job.cond:
+                job.chunks = -1
+                job.done = 0
+            for index in range(0, job.smpno, chunk):
+                if job.error:
+                    break
+                data = read_pcm(job.FileIn, job.fmt, job.start + index,
+                                min(chunk, job.smpno - index))
+                self.pipeline.put('meter', (job, npass, index // chunk, data))
+            else:
+                index = job.smpno
+        except Exception as e:
+            self._fail(job, e)
+        with job.cond:
+            job.chunks = -(-index // chunk)
+            if job.done == job.chunks:
+                self._next(job, npass)
+
+    def _next(self, job, npass):
+
+        # All the chunks of a pass have been processed (job.cond held)
+        if npass == 1 and not job.error:
+            try:
+                self._measured(job)
+                self.pipeline.put('read', (job, 2))
+                return
+            except Exception as e:
+                self._fail(job, e)
+        self._finished(job)
+
+    def _measured(self, job):
+
+        # ... COMPUTE EQUALIZATION FACTORS ...
+        job.factor, job.ref = sv56demo.equalization_factor(
+            job.states, job.params['NdB'], job.params['use_active_level'])
+        # An output that is the input itself, still to be read by the
+        # second pass, is written to a temporary file renamed over it
+        os.makedirs(os.path.dirname(job.FileOut) or '.', exist_ok=True)
+        job.path = sv56demo.output_path(job.FileIn, job.FileOut)
+        job.out = create_pcm_file(job.path, job.fmt, job.smpno)
+        job.fd = os.open(job.path, os.O_WRONLY)
+
+    def _finished(self, job):
+
+        # Reports a file, and lets the next one in
+        if job.fd is not None:
+            os.close(job.fd)
+            job.fd = None
+        if job.path is not None:
+            try:
+                sv56demo.replace_output(job.path, job.FileOut, not job.error)
+            except Exception as e:
+                self._fail(job, e)
+            job.path = None
+        if job.error:
+            row = {'file': job.FileIn, 'error': job.error}
+        else:
+            params = job.params
+            row = sv56demo.summary_statistics(job.FileIn, job.states[job.ref], job.factor,
+                                              job.NrSat, job.bitno, job.fmt.bits)
+            row.update({'channels': job.fmt.channels, 'channel': job.ref + 1,
+                        'block_size': params['N'], 'first_block': params['N1'] + 1,
+                        'blocks': job.blocks, 'desired_level_dB': float(params['NdB']),
+                        'use_active_level': params['use_active_level']})
+        row['output'] = job.FileOut
+        try:
+            self.finish(row)
+        finally:
+            self.slots.release()
+
+    def meter(self, item):
+
+        # First pass: measures the chunks of a file one after the other
+        job, npass, i, data = item
+        if npass == 1:
+            with job.cond:
+                self.pipeline.wait(job.cond, lambda: job.done == i)
+            try:
+                if not job.error:
+                    sv56demo.measure_frames(data, job.states, job.params['engine'],
+                                            job.fmt.bits)
+            except Exception as e:
+                self._fail(job, e)
+            with job.cond:
+                job.done += 1
+                job.cond.notify_all()
+                if job.done == job.chunks:
+                    self._next(job, npass)
+            return
+
+        # Second pass: equalizes the chunks, in any order
+        out = None
+        try:
+            if not job.error:
+                out = empty_pcm(job.fmt, len(data))
+                NrSat = sv56demo.equalize(sv56demo.pcm2fl(data, job.fmt.bits),
+                                          job.factor, out, job.bitno, job.fmt.bits)
+                with job.cond:
+                    job.NrSat += NrSat
+        except Exception as e:
+            self._fail(job, e)
+        self.pipeline.put('write', (job, i, out))
+
+    def write(self, item):
+
+        # Writes an equalized chunk at its place in the output file
+        job, i, out = item
+        try:
+            if out is not None and not job.error:
+                data = pcm_bytes(out)
+                offset = job.out.offset + i * job.params['chunk'] * job.fmt.block_align
+                while len(data):
+                    n = os.pwrite(job.fd, data, offset)
+                    data = data[n:]
+                    offset += n
+        except Exception as e:
+            self._fail(job, e)
+        with job.cond:
+            job.done += 1
+            if job.done == job.chunks:
+                self._next(job, 2)
+
+def main(args, parser=None):
+
+    # Runs the pipeline for parsed command-line arguments; returns the exit
+    # value, as sv56demo
+    parser = parser or build_parser()
+    for option in ('stream', 'target', 'rmstarget', 'checkpoint', 'cache', 'profile'):
+        if getattr(args, option):
+            parser.error('-%s cannot be used with sv56pipe' % option)
+    if min(args.readers, args.jobs, args.writers, args.buffers, args.files) < 1:
+        parser.error('numbers of threads, buffers and files must be positive')
+    params = sv56demo.command_params(args, parser)
+    for name in ('stream', 'cache', 'cache_size', 'checkpoint'):
+        del params[name]
+
+    # Batch mode: a row of the report per file, as the files complete
+    rows = []
+    lock = threading.Lock()
+    fid = None
+    if args.batch:
+        files = sv56demo.batch_files(args.FileIn, args.FileOut)
+        fid = open(args.batch, 'w', newline='')
+        write_row = sv56demo.report_writer(fid, args.batch)
+    else:
+        files = [(args.FileIn, args.FileOut)]
+
+    def finish(row):
+        with lock:
+            rows.append(row)
+            if args.batch:
+                write_row(row)
+                sv56demo.progress(len(rows), args.q or args.qq)
+
+    try:
+        normalizer = SV56Normalizer(finish, args.readers, args.jobs, args.writers,
+                                    args.buffers, args.files)
+        occupancy = normalizer.run(files, **params)
+    finally:
+        if fid is not None:
+            fid.close()
+
+    if args.occupancy:
+        with open(args.occupancy, 'w') as out:
+            json.dump(occupancy, out, indent=1)
+
+    errors = [row for row in rows if 'error' in row]
+    if args.batch:
+        return 5 if errors else 0
+    if errors:
+        sys.stderr.write("sv56pipe: %s: %s\n" % (args.FileIn, errors[0]['error']))
+        return 5
+
+    # ... PRINT-OUT OF RESULTS ...
+    stats = rows[0]
+    out = open(args.log, 'w') if args.log else sys.stdout
+    if args.qq:
+        sv56demo.print_p56_short_summary(out, stats)
+    else:
+        sv56demo.print_p56_long_summary(out, stats)
+    if args.log:
+        out.close()
+    return 0
+
+def build_parser():
+
+    # Command line of sv56demo, with the sizes of the pipeline
+    parser = sv56demo.build_parser()
+    parser.prog = 'sv56pipe'
+    parser.add_argument('-readers', type=int, default=READERS,
+                        help='number of reader threads [default: %d]' % READERS)
+    parser.add_argument('-writers', type=int, default=WRITERS,
+                        help='number of writer threads [default: %d]' % WRITERS)
+    parser.add_argument('-buffers', type=int, default=BUFFERS,
+                        help='chunks queued before each stage [default: %d]' % BUFFERS)
+    parser.add_argument('-files', type=int, default=FILES,
+                        help='files in flight at a time [default: %d]' % FILES)
+    parser.add_argument('-occupancy', metavar='FILE',
+                        help='write the occupancy of each stage to FILE, as JSON')
+    return parser
+
+if __name__ == '__main__':
+
+    parser = build_parser()
+    sys.exit(main(parser.parse_args(), parser))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#  ============================================================================
+#
+#  SV56SERVER.PY
+#  ~~~~~~~~~~~~~
+#
+#  Description:
+#  ~~~~~~~~~~~~
+#
+#  Long-lived measurement server: listens on a local Unix socket and runs
+#  the sv56demo command lines sent by its clients (see sv56client.py) in a
+#  pool of worker processes, where NumPy and the speech voltmeter are
+#  imported once. Each client connection is served by its own thread, so
+#  clients are served concurrently, up to the number of workers at a time.
+#
+#  The input and output files are given by path, as to sv56demo, or the
+#  client streams the input PCM data (FileIn `-') and/or receives the
+#  normalized PCM data (FileOut `-') through the socket; streamed data
+#  are kept in temporary files while the request runs.
+#
+#  Usage:
+#  ~~~~~~
+#  $ sv56server [-jobs n] [socket]
+#  where:
+#  socket           is the path of the socket to listen on [default:
+#                   $SV56_SOCKET, or /tmp/sv56.sock]
+#  Options:
+#  ~~~~~~~~
+#  -jobs n ........ number of worker processes [default: number of CPUs]
+#
+#  ============================================================================
+
+import io
+import os
+import sys
+import signal
+import argparse
+import tempfile
+import socketserver
+from contextlib import redirect_stdout, redirect_stderr
+from concurrent.futures import ProcessPoolExecutor
+
+import sv56demo
+from sv56client import DEFAULT_SOCKET
+from sv56client import send_message, recv_message, send_stream, recv_stream
+
+def init_worker():
+
+    # Interrupting the server stops it; the workers are shut down by it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def run_request(args, cwd, stream_out=False):
+
+    # Runs in a worker process: runs sv56demo for the parsed command line
+    # from the client's working directory, capturing what it prints. The
+    # statistics go with stderr when stdout carries the output data.
+    os.chdir(cwd)
+    out = io.StringIO()
+    err = io.StringIO()
+    with redirect_stdout(err if stream_out else out), redirect_stderr(err):
+        try:
+            status = sv56demo.main(args)
+        except SystemExit as e:
+            status = e.code
+        except Exception as e:
+            sys.stderr.write("sv56demo: %s: %s\n" % (type(e).__name__, e))
+            status = 1
+    return status or 0, out.getvalue(), err.getvalue()
+
+class SV56Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+
+        header, data = recv_message(self.rfile)
+        parser = sv56demo.build_parser()
+        err = io.StringIO()
+        try:
+            with redirect_stderr(err):
+                args = parser.parse_args(header.get('argv', []))
+        except SystemExit as e:
+            send_message(self.wfile, {'status': e.code, 'stderr': err.getvalue()})
+            return
+
+        # Progress flags would only reach the server's terminal
+        args.q = True
+        stream_in = args.FileIn == '-'
+        stream_out = args.FileOut == '-'
+        if args.batch and (stream_in or stream_out):
+            send_message(self.wfile, {'status': 2, 'stderr':
+                                      "sv56demo: batch mode needs files, not `-'\n"})
+            return
+
+        temps = []
+        try:
+            if stream_in:
+                fd, args.FileIn = tempfile.mkstemp(suffix='.raw')
+                temps.append(args.FileIn)
+                send_message(self.wfile, {'input': True})
+                with os.fdopen(fd, 'wb') as fid:
+                    recv_stream(self.rfile, fid)
+            if stream_out:
+                fd, args.FileOut = tempfile.mkstemp(suffix='.raw')
+                temps.append(args.FileOut)
+                os.close(fd)
+
+            status, out, err = self.server.pool.submit(
+                run_request, args, header.get('cwd', '/'), stream_out).result()
+            if stream_in:
+                out = out.replace(args.FileIn, '-')
+                err = err.replace(args.FileIn, '-')
+
+            stream_out = stream_out and status == 0
+            send_message(self.wfile, {'status': status, 'stdout': out,
+                                      'stderr': err, 'output': stream_out})
+            if stream_out:
+                with open(args.FileOut, 'rb') as fid:
+                    send_stream(self.wfile, fid)
+        finally:
+            for path in temps:
+                os.unlink(path)
+
+class SV56Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path, jobs=None):
+        socketserver.UnixStreamServer.__init__(self, path, SV56Handler)
+        self.pool = ProcessPoolExecutor(jobs, initializer=init_worker)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.shutdown()
+
+def serve(path=DEFAULT_SOCKET, jobs=None):
+
+    # Serves until interrupted; a socket left by a previous server is
+    # replaced
+    if os.path.exists(path):
+        os.unlink(path)
+    server = SV56Server(path, jobs)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='sv56server', add_help=True)
+    parser.add_argument('socket', nargs='?',
+                        default=os.environ.get('SV56_SOCKET', DEFAULT_SOCKET),
+                        help='path of the socket to listen on')
+    parser.add_argument('-jobs', type=int, help='number of worker processes')
+    args = parser.parse_args()
+
+    serve(args.socket, args.jobs)
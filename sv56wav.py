@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#  ============================================================================
+#
+#  SV56WAV.PY
+#  ~~~~~~~~~~
+#
+#  Description:
+#  ~~~~~~~~~~~~
+#
+#  Access to the PCM data of the files sv56demo works on: headerless
+#  16-bit files, as in the C demo program, or WAV (RIFF) files of 16, 24
+#  or 32-bit PCM data with any number of channels. The data are memory-
+#  mapped (or read) as they are, as (frames, channels) arrays; 24-bit data,
+#  for which there is no NumPy type, are seen through PCM24, which converts
+#  them from and to int32 as they are read or written.
+#
+#  A file is taken as WAV if it starts with a RIFF/WAVE header, whatever
+#  its name. The size in the data chunk header of WAV files written while
+#  streaming (0 or 0xFFFFFFFF) is taken as "up to the end of the file".
+#  Outputs that are not regular files (/dev/null, pipes) are written in
+#  order rather than mapped; so are the outputs of stream_pcm(), and the
+#  inputs of PCMFile are read a chunk at a time, for constant memory.
+#
+#  ============================================================================
+
+import os
+import stat
+import struct
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+WAV_BITS = (16, 24, 32)
+
+# Canonical header of the WAV files written: RIFF, fmt and data chunks
+WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+class SV56Format(object):
+
+    def __init__(self):
+        self.wav = False    # (bool) WAV file, rather than headerless
+        self.sf = None      # (float) sampling frequency, in Hz, if known
+        self.bits = 16      # (unsigned long) bits per sample
+        self.channels = 1   # (unsigned long) number of channels
+        self.offset = 0     # (unsigned long) offset of the data, in bytes
+        self.frames = 0     # (unsigned long) number of samples per channel
+
+    def __repr__(self):
+        return "<SV56Format '%s' : '%s'>" % (self.bits, self.channels)
+
+    @property
+    def block_align(self):
+        return self.channels * self.bits // 8
+
+class PCM24(object):
+
+    # 24-bit little-endian PCM data, kept as a (..., 3) array of bytes: it
+    # is indexed as the (...) array of samples, converts to an int32 array
+    # and is assigned from integer or (truncated) float arrays
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.raw)
+
+    @property
+    def shape(self):
+        return self.raw.shape[:-1]
+
+    def __getitem__(self, key):
+        return PCM24(self.raw[key])
+
+    def __array__(self, dtype=None, copy=None):
+        x = np.zeros(self.raw.shape[:-1] + (4,), dtype=np.uint8)
+        x[..., 1:] = self.raw
+        x = x.view('<i4')[..., 0] >> 8
+        return x if dtype is None else x.astype(dtype)
+
+    def __setitem__(self, key, value):
+        x = np.ascontiguousarray(value).astype('<i4')
+        self.raw[key][...] = x[..., None].view(np.uint8)[..., :3]
+
+def pcm_format(path):
+
+    # Format of the PCM data of a file: headerless 16-bit, or from the WAV
+    # header
+    fmt = SV56Format()
+    size = os.stat(path).st_size
+    with open(path, 'rb') as fid:
+        riff = fid.read(12)
+        if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:] != b'WAVE':
+            fmt.frames = size // fmt.block_align
+            return fmt
+        fmt.wav = True
+
+        # Walks the chunks up to the data one
+        have_fmt = False
+        while True:
+            head = fid.read(8)
+            if len(head) < 8:
+                raise ValueError("%s: WAV file without a data chunk" % path)
+            ckid, cksize = struct.unpack('<4sI', head)
+            if ckid == b'fmt ':
+                body = fid.read(cksize + (cksize & 1))
+                tag, fmt.channels, fmt.sf, _, align, fmt.bits = struct.unpack('<HHIIHH', body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and cksize >= 26:
+                    tag, = struct.unpack('<H', body[24:26])
+                if (tag != WAVE_FORMAT_PCM or fmt.bits not in WAV_BITS or
+                        fmt.channels < 1 or align != fmt.block_align):
+                    raise ValueError("%s: unsupported WAV format (tag %d, %d bits); "
+                                     "only 16, 24 and 32-bit PCM are" % (path, tag, fmt.bits))
+                fmt.sf = float(fmt.sf)
+                have_fmt = True
+            elif ckid == b'data':
+                if not have_fmt:
+                    raise ValueError("%s: WAV data chunk before the fmt chunk" % path)
+                fmt.offset = fid.tell()
+                nbytes = size - fmt.offset
+                if cksize not in (0, 0xFFFFFFFF):
+                    nbytes = min(nbytes, cksize)
+                fmt.frames = nbytes // fmt.block_align
+                return fmt
+            else:
+                fid.seek(cksize + (cksize & 1), 1)
+
+def _dtype(fmt):
+    return np.uint8 if fmt.bits == 24 else np.dtype('<i%d' % (fmt.bits // 8))
+
+def _shape(fmt, frames):
+    return (frames, fmt.channels, 3) if fmt.bits == 24 else (frames, fmt.channels)
+
+def _wrap(fmt, data):
+    return PCM24(data) if fmt.bits == 24 else data
+
+def map_pcm(path, fmt, start=0, frames=None, mode='r'):
+
+    # Memory-maps `frames' frames (by default, up to the end of the data)
+    # from frame `start' on, as a (frames, channels) array; no data is read
+    # until used
+    if frames is None or frames > fmt.frames - start:
+        frames = fmt.frames - start
+    if frames <= 0:
+        return _wrap(fmt, np.zeros(_shape(fmt, 0), dtype=_dtype(fmt)))
+    return _wrap(fmt, np.memmap(path, dtype=_dtype(fmt), mode=mode,
+                                offset=fmt.offset + start * fmt.block_align,
+                                shape=_shape(fmt, frames)))
+
+def read_pcm(path, fmt, start=0, frames=None):
+
+    # Same as map_pcm(), reading the frames into memory
+    if frames is None or frames > fmt.frames - start:
+        frames = fmt.frames - start
+    frames = max(frames, 0)
+    with open(path, 'rb') as fid:
+        fid.seek(fmt.offset + start * fmt.block_align)
+        data = np.fromfile(fid, dtype=_dtype(fmt), count=int(np.prod(_shape(fmt, frames))))
+    return _wrap(fmt, data.reshape(_shape(fmt, frames)))
+
+def wav_header(fmt, frames):
+
+    # Header of a WAV file of `frames' frames in the given format
+    nbytes = frames * fmt.block_align
+    if nbytes + WAV_HEADER.size > 0xFFFFFFFF:
+        raise ValueError("%d frames are too many for a WAV file" % frames)
+    return WAV_HEADER.pack(b'RIFF', WAV_HEADER.size - 8 + nbytes + (nbytes & 1),
+                           b'WAVE', b'fmt ', 16, WAVE_FORMAT_PCM, fmt.channels,
+                           int(fmt.sf), int(fmt.sf) * fmt.block_align,
+                           fmt.block_align, fmt.bits, b'data', nbytes)
+
+class PCMFile(object):
+
+    # Input read one chunk at a time: it is sliced by frames as the map of
+    # map_pcm(), but each slice is read from the file when taken, so that
+    # no page of the file stays mapped (and resident) once used
+    def __init__(self, path, fmt, start=0, frames=None):
+        if frames is None or frames > fmt.frames - start:
+            frames = fmt.frames - start
+        self.path = path
+        self.fmt = fmt
+        self.start = start
+        self.frames = max(frames, 0)
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, key):
+        start, stop, step = key.indices(self.frames)
+        return read_pcm(self.path, self.fmt, self.start + start, max(stop - start, 0))
+
+class PCMStream(object):
+
+    # Output that is not a regular file (a device such as /dev/null, a
+    # pipe): it cannot be sized nor mapped, so its data are written in
+    # order, one chunk at a time, after the header
+    def __init__(self, fid, fmt):
+        self.fid = fid
+        self.fmt = fmt
+
+    def __len__(self):
+        return self.fmt.frames
+
+    def write(self, data):
+        self.fid.write(pcm_bytes(data))
+
+    def close(self):
+        if self.fmt.wav and self.fmt.frames * self.fmt.block_align & 1:
+            self.fid.write(b'\0')
+        self.fid.close()
+
+def _regular(path):
+
+    # Whether path is a regular file, or does not exist yet
+    try:
+        return stat.S_ISREG(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return True
+
+def _output_format(fmt, frames):
+    out = SV56Format()
+    out.wav, out.sf, out.bits, out.channels = fmt.wav, fmt.sf, fmt.bits, fmt.channels
+    out.frames = frames
+    return out
+
+def create_pcm_file(path, fmt, frames):
+
+    # Creates a file for `frames' frames in the format of `fmt' (with a WAV
+    # header if it is WAV); returns the format of the file, whose data are
+    # to be written at its offset. Only regular files are sized.
+    out = _output_format(fmt, frames)
+    with open(path, 'wb') as fid:
+        if out.wav:
+            fid.write(wav_header(out, frames))
+        out.offset = fid.tell()
+        nbytes = frames * out.block_align
+        if stat.S_ISREG(os.fstat(fid.fileno()).st_mode):
+            fid.truncate(out.offset + nbytes + (nbytes & 1 if out.wav else 0))
+    return out
+
+def create_pcm(path, fmt, frames):
+
+    # Same as create_pcm_file(), memory-mapping the data for writing; a path
+    # that is not a regular file is opened once, its header written, and
+    # returned as a PCMStream
+    if not _regular(path):
+        return stream_pcm(path, fmt, frames)
+    return map_pcm(path, create_pcm_file(path, fmt, frames), 0, frames, 'r+')
+
+def stream_pcm(path, fmt, frames):
+
+    # Same as create_pcm_file(), returning a PCMStream that writes the data
+    # in order through the file rather than a map of it
+    if not _regular(path):
+        out = _output_format(fmt, frames)
+        fid = open(path, 'wb')
+        if out.wav:
+            fid.write(wav_header(out, frames))
+        return PCMStream(fid, out)
+    out = create_pcm_file(path, fmt, frames)
+    fid = open(path, 'r+b')
+    fid.seek(out.offset)
+    return PCMStream(fid, out)
+
+def flush_pcm(data):
+
+    # Writes the data of a map returned by create_pcm() back to its file
+    raw = data.raw if isinstance(data, PCM24) else data
+    if isinstance(raw, np.memmap):
+        raw.flush()
+
+def empty_pcm(fmt, frames):
+
+    # In-memory (frames, channels) buffer of PCM data in the format of
+    # `fmt', as returned by read_pcm(); pcm_bytes() gives its data
+    return _wrap(fmt, np.empty(_shape(fmt, frames), dtype=_dtype(fmt)))
+
+def pcm_bytes(data):
+
+    # The bytes of a buffer returned by read_pcm() or empty_pcm(), as they
+    # are in the file
+    return memoryview(np.ascontiguousarray(data.raw if isinstance(data, PCM24) else data)).cast('B')
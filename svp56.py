@@ -41,6 +41,95 @@
 # speech_voltmeter .............. measurement of the active speech level of
 #                                 data in a buffer according to P.56. Other 
 # 				relevant statistics are also available.
+#                                 The sample loop is run either by the
+#                                 reference (per-sample) engine or by the
+#                                 vectorized NumPy engine.
+# 
+# speech_voltmeter_accumulate ... updates the P.56 counts with the data in a
+#                                 buffer, without computing the statistics.
+# 
+# speech_voltmeter_finalize ..... computes (and caches until more data is
+#                                 accumulated) the active speech level and
+#                                 the other statistics from the counts.
+# 
+# speech_voltmeter_pcm .......... measurement of the active speech level of
+#                                 integer PCM data of a given resolution,
+#                                 without converting them to normalized float.
+# 
+# speech_voltmeter_partial ...... measures one shard of a signal into a
+#                                 partial state, independently of the data
+#                                 before the shard.
+# 
+# speech_voltmeter_merge ........ appends a partial state to a speech
+#                                 voltmeter state; the counts are the same as
+#                                 if the shard had been accumulated.
+# 
+# init_speech_voltmeter_array ... initialization of a SVP56_array_state for
+#                                 measuring several signals together.
+# 
+# init_speech_voltmeter_array_from  initialization of a SVP56_array_state
+#                                 with the counts of single-signal states.
+# 
+# speech_voltmeter_array ........ measurement of the active speech level of
+#                                 each row of a (signals, samples) array, or
+#                                 of each channel of interleaved data, in one
+#                                 vectorized pass; integer PCM data are
+#                                 measured at their own full scale.
+# 
+# init_speech_voltmeter_hist .... initialization of a SVP56_hist_state.
+# 
+# speech_voltmeter_hist_accumulate  updates the envelope and gap histograms
+#                                 with the data in a buffer.
+# 
+# speech_voltmeter_hist_counts .. activity counts for given thresholds and
+#                                 hangover, from the histograms.
+# 
+# speech_voltmeter_hist_level ... active speech level and activity factor
+#                                 for a given margin and hangover, from the
+#                                 histograms.
+# 
+# speech_voltmeter_index ........ builds the activity prefix index of a
+#                                 signal, in one pass.
+# 
+# speech_voltmeter_index_query .. statistics of a range of an indexed signal,
+#                                 in constant time.
+# 
+# speech_voltmeter_index_save ... saves an activity prefix index to a file.
+# 
+# speech_voltmeter_index_load ... memory-maps an activity prefix index file.
+# 
+# speech_voltmeter_state_pack ... serializes a speech voltmeter state into a
+#                                 fixed-size record (see STATE_STRUCT).
+# 
+# speech_voltmeter_state_unpack . deserializes a speech voltmeter state.
+# 
+# speech_voltmeter_state_save ... checkpoints speech voltmeter states to a file.
+# 
+# speech_voltmeter_state_load ... loads the states of a checkpoint file, to
+#                                 resume measuring.
+# 
+# init_speech_voltmeter_window .. initialization of a SVP56_window.
+# 
+# speech_voltmeter_window ....... adds a block to a sliding window and
+#                                 returns the active speech level of the
+#                                 window, in constant time.
+# 
+# speech_voltmeter_window_stream  generator of the window statistics for a
+#                                 stream of blocks.
+#
+# speech_voltmeter_profile ...... installs (or removes) the SVP56_profile
+#                                 recording the time spent in each stage.
+#
+# speech_voltmeter_profile_installed  the SVP56_profile installed, if any.
+#
+# speech_voltmeter_profile_stage  records one run of a stage in the profile
+#                                 installed, if any.
+#
+# speech_voltmeter_profile_merge  adds stage records (e.g. those of a worker
+#                                 process) to the profile installed, if any.
+#
+# speech_voltmeter_profile_report  the records of a profile and the peak
+#                                 resident memory, as a dict (e.g. for JSON).
 # 
 # HISTORY:
 # 
@@ -59,13 +148,73 @@
 # 				  suggested by Mr Kabal. 
 # 				  Upper and lower bounds are updated during the interpolation.
 # 						<Cyril Guillaume & Stephane Ragot -- stephane.ragot@francetelecom.com>
+#    16.Oct.26 v2.4 Added the NumPy engine to speech_voltmeter(); envelope,
+#                   activity and hangover counts match the reference loop
+#                   bit for bit.
+#    16.Oct.26 v2.5 Split speech_voltmeter() into speech_voltmeter_accumulate()
+#                   and speech_voltmeter_finalize(); the statistics are only
+#                   computed on demand. Fixed the DC level not being saved
+#                   and the missing return for silence below the margin.
+#    16.Oct.26 v2.6 Added speech_voltmeter_partial() and speech_voltmeter_merge()
+#                   to measure shards of a signal in parallel.
+#    16.Oct.26 v2.7 Added SVP56_array_state and speech_voltmeter_array() for
+#                   multichannel data and batches of equal-length signals;
+#                   integer PCM data are measured against scaled thresholds.
+#    16.Oct.26 v2.8 Added the envelope-histogram engine (SVP56_hist_state),
+#                   whose results can be recomputed for other thresholds,
+#                   margin and hangover without the input data.
+#    16.Oct.26 v2.9 Added the activity prefix index (SVP56_index) for the
+#                   statistics of arbitrary ranges of a signal.
+#    16.Oct.26 v2.10 Added the sliding-window speech voltmeter (SVP56_window).
+#    16.Oct.26 v2.11 Added speech_voltmeter_pcm() for int16/int32 PCM data.
+#    16.Oct.26 v2.12 SVP56_state has fixed slots and a sample-offset watermark,
+#                   and can be checkpointed to fixed-size binary records.
+#    16.Oct.26 v2.13 Added the optional profile (SVP56_profile) of the time
+#                   spent metering and computing the statistics, and of the
+#                   bin_interp iterations.
+#    16.Oct.26 v2.14 Added init_speech_voltmeter_array_from(); array states
+#                   carry the sample-offset watermark, and their integer
+#                   sums are taken as for a single signal.
+#    16.Oct.26 v2.15 Measuring shards is profiled; stage records of worker
+#                   processes can be merged into the profile installed.
+#    16.Oct.26 v2.16 The activity counts of a buffer are taken from the
+#                   levels of its envelope and their running maximum over
+#                   the hangover; array states are measured by groups of
+#                   rows, with no copy per signal. SciPy is documented as
+#                   optional, with the speed of the engine without it.
 # 
 # =============================================================================
 
+import os
+import sys
 import math
+import time
+import struct
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from scipy.signal import lfilter
+except ImportError:
+    lfilter = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 class SVP56_state(object):
 
+    # Fixed set of fields, so that states are small and cheap to create
+    # and to (de)serialize in large numbers (see speech_voltmeter_state_pack)
+    __slots__ = ('f', 'a', 'c', 'hang', 'n', 's', 'sq', 'p', 'q', 'max',
+                 'refdB', 'rmsdB', 'maxP', 'maxN', 'DClevel', 'ActivityFactor',
+                 'ActiveSpeechLevel', 'stale', 'offset')
+
     def __init__(self):
         self.f = 0.0        # (float) sampling frequency, in Hz
         self.a = []         # (unsigned long) activity count
@@ -83,18 +232,28 @@ class SVP56_state(object):
         self.maxN = 0.0     # (double) maximum negative values since last reset
         self.DClevel = 0.0  # (double) average level since last reset
         self.ActivityFactor = 0.0 # (double) Activity factor since last reset
+        self.ActiveSpeechLevel = -100.0 # (double) active speech level since last reset
+        self.stale = False  # (bool) data accumulated since the last finalize
+        self.offset = 0     # (unsigned long) position in the source of the next
+                            # sample to be measured (checkpoint watermark)
 
     def __repr__(self):
         return "<SVP56_state '%s' : '%s'>" % (self.f, self.a)
 
     def SVP56_get_rms_dB(self):
+        speech_voltmeter_finalize(self)
         return self.rmsdB
         
     def SVP56_get_DC_level(self):
+        speech_voltmeter_finalize(self)
         return self.DClevel
         
     def SVP56_get_activity(self):
+        speech_voltmeter_finalize(self)
         return self.ActivityFactor * 100.0
+
+    def SVP56_get_active_level(self):
+        return speech_voltmeter_finalize(self)
     
     def SVP56_get_pos_max(self):
         return self.maxP
@@ -108,12 +267,237 @@ class SVP56_state(object):
     def SVP56_get_smpno(self):
         return self.n
 
+class SVP56_partial(SVP56_state):
+
+    # Counts of one shard of a signal, measured independently of the data
+    # preceding it (see speech_voltmeter_partial), so that the shards of a
+    # long file can be measured in parallel and merged exactly.
+    __slots__ = ('p0', 'q0', 'first')
+
+    def __init__(self):
+        SVP56_state.__init__(self)
+        self.p0 = 0.0       # (double) intermediate quantity at the shard start
+        self.q0 = 0.0       # (double) envelope at the shard start
+        self.first = []     # (unsigned long) samples before the 1st one above
+                            # each threshold, limited to the hangover time
+
+class SVP56_array_state(object):
+
+    # State of the speech voltmeter for several signals of the same length
+    # measured together: each quantity of SVP56_state is kept as a NumPy
+    # array with one value per signal (one row per signal for the activity
+    # and hangover counts), and the getters return arrays.
+    def __init__(self):
+        self.f = 0.0        # (float) sampling frequency, in Hz
+        self.nsig = 0       # (unsigned long) number of signals
+        self.a = None       # (unsigned long) activity count [signal, threshold]
+        self.c = []         # (double) threshold level; 15 is the no.of thres.
+        self.hang = None    # (unsigned long) hangover count [signal, threshold]
+        self.n = 0          # (unsigned long) number of samples per signal since last reset
+        self.s = None       # (double) sum of all samples since last reset
+        self.sq = None      # (double) squared sum of samples since last reset
+        self.p = None       # (double) intermediate quantities
+        self.q = None       # (double) envelope
+        self.max = None     # (double) max absolute value found since last reset
+        self.refdB = 0.0    # (double) 0 dB reference point, in [dB]
+        self.rmsdB = None   # (double) rms value found since last reset
+        self.maxP = None    # (double) maximum positive values since last reset
+        self.maxN = None    # (double) maximum negative values since last reset
+        self.DClevel = None # (double) average level since last reset
+        self.ActivityFactor = None # (double) Activity factor since last reset
+        self.ActiveSpeechLevel = None # (double) active speech level since last reset
+        self.stale = False  # (bool) data accumulated since the last finalize
+        self.offset = 0     # (unsigned long) position in the source of the next
+                            # sample to be measured (checkpoint watermark)
+
+    def __repr__(self):
+        return "<SVP56_array_state '%s' : '%s'>" % (self.f, self.nsig)
+
+    def channel(self, i):
+
+        # Single-signal state holding the counts of signal i
+        state = SVP56_state()
+        state.f = self.f
+        state.a = self.a[i].tolist()
+        state.c = list(self.c)
+        state.hang = self.hang[i].tolist()
+        state.n = self.n
+        state.s = float(self.s[i])
+        state.sq = float(self.sq[i])
+        state.p = float(self.p[i])
+        state.q = float(self.q[i])
+        state.max = float(self.max[i])
+        state.refdB = self.refdB
+        state.maxP = float(self.maxP[i])
+        state.maxN = float(self.maxN[i])
+        state.stale = self.n > 0
+        state.offset = self.offset
+        return state
+
+    def SVP56_get_rms_dB(self):
+        speech_voltmeter_array_finalize(self)
+        return self.rmsdB
+
+    def SVP56_get_DC_level(self):
+        speech_voltmeter_array_finalize(self)
+        return self.DClevel
+
+    def SVP56_get_activity(self):
+        speech_voltmeter_array_finalize(self)
+        return self.ActivityFactor * 100.0
+
+    def SVP56_get_active_level(self):
+        return speech_voltmeter_array_finalize(self)
+
+    def SVP56_get_pos_max(self):
+        return self.maxP
+
+    def SVP56_get_neg_max(self):
+        return self.maxN
+
+    def SVP56_get_abs_max(self):
+        return self.max
+
+    def SVP56_get_smpno(self):
+        return self.n
+
+
+class SVP56_hist_state(object):
+
+    # State of the envelope-histogram speech voltmeter: instead of counting
+    # activity for the 15 octave thresholds with a fixed hangover, it keeps
+    # the histogram of the envelope q over a dense grid of thresholds and,
+    # for each grid threshold, the histogram of the lengths of the gaps
+    # (runs of samples below the threshold following one above it), so
+    # that activity and active level can be computed afterwards for any
+    # grid threshold, margin and hangover (see speech_voltmeter_hist_counts
+    # and speech_voltmeter_hist_level).
+    def __init__(self):
+        self.f = 0.0        # (float) sampling frequency, in Hz
+        self.steps = 0      # (unsigned long) grid thresholds per octave
+        self.c = []         # (double) grid threshold levels, 2^-15 to 1
+        self.hist = None    # (unsigned long) envelope histogram; bin k counts
+                            # the samples with k grid thresholds at or below q
+        self.step = 0       # (unsigned long) gap histogram bin width, in samples
+        self.gapno = None   # (unsigned long) number of gaps [threshold, bin]
+        self.gapsum = None  # (unsigned long) sum of gap lengths [threshold, bin]
+        self.run = None     # (long) length of the gap open at the end of the
+                            # data, per threshold; -1 before the 1st sample above
+        self.n = 0          # (unsigned long) number of samples read since last reset
+        self.s = 0.0        # (double) sum of all samples since last reset
+        self.sq = 0.0       # (double) squared sum of samples since last reset
+        self.p = 0.0        # (double) intermediate quantities
+        self.q = 0.0        # (double) envelope
+        self.max = 0.0      # (double) max absolute value found since last reset
+        self.refdB = 0.0    # (double) 0 dB reference point, in [dB]
+        self.maxP = 0.0     # (double) maximum positive values since last reset
+        self.maxN = 0.0     # (double) maximum negative values since last reset
+
+    def __repr__(self):
+        return "<SVP56_hist_state '%s' : '%s'>" % (self.f, self.steps)
+
+
+class SVP56_index(object):
+
+    # Activity prefix index of a signal (see speech_voltmeter_index): one
+    # record per block boundary holds the sums of x and x*x and the activity
+    # counts of the samples before it, the hangover counts at it, and the
+    # number of samples from it to the next one above each threshold
+    # (limited to the hangover time), so that the statistics of any range
+    # of blocks come from two records.
+    def __init__(self):
+        self.f = 0.0        # (float) sampling frequency, in Hz
+        self.N = 0          # (unsigned long) block size, in samples
+        self.n = 0          # (unsigned long) number of samples indexed
+        self.table = None   # records of INDEX_RECORD, one per block boundary
+
+    def __repr__(self):
+        return "<SVP56_index '%s' : '%s'>" % (self.f, self.n)
+
+
+class SVP56_window(object):
+
+    # State of the sliding-window speech voltmeter: the data are measured
+    # continuously in `state', and the contribution of each block (sums,
+    # activity counts, peaks) is kept in a ring buffer covering the last
+    # `length' samples, whose totals are updated as blocks come and go.
+    def __init__(self):
+        self.f = 0.0        # (float) sampling frequency, in Hz
+        self.length = 0     # (unsigned long) window length, in samples
+        self.state = None   # (SVP56_state) continuous measurement of the data
+        self.blocks = None  # ring buffer of the blocks in the window
+        self.seq = 0        # (unsigned long) number of blocks received
+        self.n = 0          # (unsigned long) number of samples in the window
+        self.s = 0.0        # (double) sum of the samples in the window
+        self.sq = 0.0       # (double) squared sum of the samples in the window
+        self.a = None       # (unsigned long) activity count in the window
+        self.peaks = None   # max. absolute, positive and negative values of
+                            # the blocks, in decreasing order of value
+        self.stats = None   # (SVP56_state) statistics of the window
+
+    def __repr__(self):
+        return "<SVP56_window '%s' : '%s'>" % (self.f, self.length)
+
+class SVP56_profile(object):
+
+    # Where the time goes while measuring and equalizing: for each stage
+    # (e.g. `meter', the sample loop), the calls, time and data processed,
+    # plus the work of bin_interp. Stages are only recorded while the
+    # profile is installed with speech_voltmeter_profile(); the callback,
+    # if any, is called after each stage run as
+    # callback(stage, seconds, samples, nbytes).
+    def __init__(self, callback=None):
+        self.stages = {}    # (dict) per stage: calls, time [s], samples, bytes
+        self.interps = 0    # (unsigned long) calls of bin_interp
+        self.iterations = 0 # (unsigned long) iterations of bin_interp
+        self.relaxations = 0 # (unsigned long) tolerance relaxations of bin_interp
+        self.callback = callback # (callable) called after each stage run
+
+    def __repr__(self):
+        return "<SVP56_profile '%s' : '%s'>" % (len(self.stages), self.interps)
+
 # const variables
 T = 0.03       # in [s]
 H = 0.20       # in [s]
 M = 15.9       # in [dB]
 THRES_NO = 15  # number of thresholds in the speech voltmeter
 MIN_LOG_OFFSET=1e-20 # Hooked to eliminate sigularity with log(0.0) (happens w/all-0 data blocks
+W = 2.0        # envelope warm-up before a shard, in [s]
+HIST_STEPS = 8 # grid thresholds per octave of the envelope-histogram engine
+HIST_DT = 0.005  # width of the gap histogram bins, in [s]
+HIST_HMAX = 1.0  # largest hangover of the envelope-histogram engine, in [s]
+ARRAY_BLOCK = 1 << 17 # samples of the signals measured together at a time
+INDEX_BLOCK = 1600 # block size of the activity prefix index, in samples
+INDEX_MAGIC = b'SVP56IDX' # identifies an activity prefix index file
+INDEX_HEADER = struct.Struct('<8sdqq') # magic, f, N and n of an index file
+INDEX_OFFSET = 64 # size of the index file header, in bytes
+STATE_MAGIC = b'SVP56ST1' # identifies a serialized speech voltmeter state
+# serialized speech voltmeter state: magic, f, n, offset, s, sq, p, q, max,
+# maxP, maxN, refdB, activity and hangover counts
+STATE_STRUCT = struct.Struct('<8sdqq8d%dq%dq' % (THRES_NO, THRES_NO))
+
+# record of the activity prefix index, one per block boundary
+if np is not None:
+    INDEX_RECORD = np.dtype([('s', '<f8'), ('sq', '<f8'),
+                             ('a', '<i8', (THRES_NO,)),
+                             ('hang', '<i4', (THRES_NO,)),
+                             ('first', '<i4', (THRES_NO,))])
+
+# engines available to run the sample loop of speech_voltmeter
+ENGINE_REFERENCE = 'reference'
+ENGINE_NUMPY = 'numpy'
+ENGINES = (ENGINE_REFERENCE, ENGINE_NUMPY)
+
+# profile installed by speech_voltmeter_profile(), or None (no profiling)
+_profile = None
+
+def _bin_interp_profile(iterno):
+
+    # Records a bin_interp run of iterno iterations; the tolerance is
+    # relaxed in every iteration after the 20th
+    _profile.interps += 1
+    _profile.iterations += iterno
+    _profile.relaxations += max(0, iterno - 20)
     
 def bin_interp(upcount, lwcount, upthr, lwthr, Margin, tol):
 
@@ -125,9 +509,13 @@ def bin_interp(upcount, lwcount, upthr, lwthr, Margin, tol):
     iterno = 1
     diff = math.fabs((upcount - upthr) - Margin)
     if diff < tol:
+        if _profile is not None:
+            _bin_interp_profile(iterno)
         return upcount
     diff = math.fabs((lwcount - lwthr) - Margin)
     if diff < tol:
+        if _profile is not None:
+            _bin_interp_profile(iterno)
         return lwcount
     
     # Initialize first middle for given (initial) bounds
@@ -160,6 +548,8 @@ def bin_interp(upcount, lwcount, upthr, lwthr, Margin, tol):
 
     # Since the tolerance has been satisfied, midcount is selected 
     # as the interpolated value with a tol [dB] tolerance. */
+    if _profile is not None:
+        _bin_interp_profile(iterno)
     return midcount
         
 def init_speech_voltmeter(state, sampl_freq):
@@ -181,6 +571,7 @@ def init_speech_voltmeter(state, sampl_freq):
         
     # Inicialization for the quantities used in the two P.56's processes
     state.s = state.sq = state.n = state.p = state.q = 0
+    state.offset = 0
     
     # Inicialization of other quantities referring to state variables
     state.max = 0
@@ -190,11 +581,129 @@ def init_speech_voltmeter(state, sampl_freq):
     # Defining the 0 dB reference level in terms of normalized values
     state.refdB = 0 # dBov
         
-def speech_voltmeter(buffer, state):
-    
-    # Some initializations
-    I = math.floor(H * state.f + 0.5)
-    g = math.exp(-1.0 / (state.f * T))
+def _envelope_numpy(absx, p0, q0, g):
+
+    # Implements Process 2 of P.56 for the whole buffer, along its last axis.
+    # lfilter() runs the same first-order recursion, in the same order of
+    # operations, as the reference loop, so p and q are identical to the
+    # last bit. The initial condition g*p0 (g*q0) carries the envelope over
+    # from the previous call.
+    if lfilter is not None:
+        p = lfilter([1 - g], [1, -g], absx, axis=-1, zi=(g * np.asarray(p0, dtype=np.float64))[..., None])[0]
+        q = lfilter([1 - g], [1, -g], p, axis=-1, zi=(g * np.asarray(q0, dtype=np.float64))[..., None])[0]
+        return p, q
+
+    # Without SciPy (an optional dependency, see README.md) only the
+    # recursion itself stays in Python: the NumPy engine then runs at about
+    # a fifth of its speed, still several times the reference loop
+    p = np.empty_like(absx)
+    q = np.empty_like(absx)
+    p0 = np.broadcast_to(p0, absx.shape[:-1])
+    q0 = np.broadcast_to(q0, absx.shape[:-1])
+    for i in np.ndindex(absx.shape[:-1]):
+        sp = float(p0[i])
+        sq = float(q0[i])
+        for k, x in enumerate(absx[i].tolist()):
+            sp = g * sp + (1 - g) * x
+            sq = g * sq + (1 - g) * sp
+            p[i + (k,)] = sp
+            q[i + (k,)] = sq
+    return p, q
+
+def _activity_numpy(q, c, a, hang, I):
+
+    # Applies threshold to the envelope q, of shape (signals, samples); the
+    # activity and hangover counts, of shape (signals, THRES_NO), are updated
+    # in place. A sample is counted for threshold j if the envelope is at or
+    # above c[j] at any of the I+1 samples up to it (the hangover), i.e. if
+    # the highest level (number of thresholds reached) over that window is
+    # above j. The levels are kept as int8, after I leading samples standing
+    # for the data before: the last sample above c[j] there, I-hang-1, is
+    # given level j+1 (the hangover counts decrease with j, as the samples
+    # above c[j] are also above the lower thresholds).
+    nsig, n = q.shape
+    w = I + 1
+    P = I + n
+    level = np.zeros((nsig, -(-P // w) * w), dtype=np.int8)
+    for cj in c:
+        np.add(level[:, I:P], q >= cj, out=level[:, I:P], casting='unsafe')
+    rows, j = np.nonzero(hang < I)
+    np.maximum.at(level, (rows, I - 1 - hang[rows, j]), j + 1)
+
+    # Highest level over the window of each sample, from the running maxima
+    # forwards and backwards within blocks of w samples (van Herk/Gil-Werman)
+    blocks = level.reshape(nsig, -1, w)
+    fwd = np.maximum.accumulate(blocks, axis=2).reshape(nsig, -1)
+    bwd = np.maximum.accumulate(blocks[..., ::-1], axis=2)[..., ::-1].reshape(nsig, -1)
+    peak = np.maximum(bwd[:, :n], fwd[:, I:P])
+
+    # Samples counted, from the histogram of the window maxima; the
+    # hangover count of threshold j is the number of samples after the last
+    # one of level above j, found from the running maximum of the last w
+    # levels backwards
+    tail = np.maximum.accumulate(level[:, P-w:P][:, ::-1], axis=1)
+    for i in range(nsig):
+        a[i] += np.cumsum(np.bincount(peak[i].view(np.uint8), minlength=THRES_NO + 1)[::-1])[-2::-1]
+        reached = np.cumsum(np.bincount(tail[i].view(np.uint8), minlength=THRES_NO + 1)[::-1])[-2::-1]
+        hang[i] = np.minimum(w - reached, I)
+
+def _sums_numpy(x):
+
+    # Sum and sum of squares of the data x along its last axis: in int64
+    # for integer data (the sum of squares in float64 beyond 16 bits, where
+    # int64 would overflow), in float64 otherwise. The rows of contiguous
+    # 2-D data are summed in the same order as one-dimensional data.
+    if x.dtype.kind in 'iu':
+        return x.sum(axis=-1, dtype=np.int64), np.einsum(
+            '...i,...i->...', x, x, dtype=np.int64 if x.dtype.itemsize <= 2 else np.float64)
+    return x.sum(axis=-1), np.sum(x * x, axis=-1)
+
+def _speech_voltmeter_numpy(buffer, state, I, g, scale=1):
+
+    # With integer PCM data, scale is their full-scale value: the data are
+    # measured as they are, against thresholds and an envelope scaled to
+    # the integer domain, and only the sums and peaks are normalized. The
+    # peaks and sums of integer data are taken on the buffer itself, in
+    # int64 (the sum of squares in float64 beyond 16 bits, where int64
+    # would overflow); only |x| is converted, for the envelope.
+    x = np.asarray(buffer).ravel()
+    if x.dtype.kind in 'iu':
+        absx = np.abs(x, dtype=np.float64)
+    else:
+        x = np.asarray(x, dtype=np.float64)
+        absx = np.abs(x)
+    s, sq = _sums_numpy(x)
+    smpno = len(x)
+    if smpno == 0:
+        return absx
+
+    # Max. absolute, positive and negative values
+    state.max = max(state.max, float(absx.max()) / scale)
+    state.maxP = max(state.maxP, float(x.max()) / scale)
+    state.maxN = min(state.maxN, float(x.min()) / scale)
+
+    # Implements Process 1 of P.56
+    state.sq += float(sq) / (scale * scale)
+    state.s  += float(s) / scale
+    state.n  += smpno
+
+    # Implements Process 2 of P.56
+    p, q = _envelope_numpy(absx, state.p * scale, state.q * scale, g)
+    state.p = float(p[-1]) / scale
+    state.q = float(q[-1]) / scale
+
+    # Applies threshold to the envelope q
+    a = np.array([state.a], dtype=np.int64)
+    hang = np.array([state.hang], dtype=np.int64)
+    _activity_numpy(q[None, :], [c * scale for c in state.c], a, hang, I)
+    state.a = a[0].tolist()
+    state.hang = hang[0].tolist()
+
+    # The envelope is also needed to build partial states
+    return q
+
+def _speech_voltmeter_reference(buffer, state, I, g):
+
     smpno = len(buffer)
 
     # Calculates statistics for all given data points
@@ -228,42 +737,860 @@ def speech_voltmeter(buffer, state):
             if (state.q < state.c[j]) and (state.hang[j] < I):
                 state.a[j] += 1
                 state.hang[j] += 1
-   
+
+def speech_voltmeter_accumulate(buffer, state, engine=ENGINE_REFERENCE):
+    
+    # Some initializations
+    I = math.floor(H * state.f + 0.5)
+    g = math.exp(-1.0 / (state.f * T))
+
+    # Runs the sample loop with the selected engine
+    if _profile is not None:
+        t0 = time.perf_counter()
+    n = state.n
+    if engine == ENGINE_REFERENCE:
+        _speech_voltmeter_reference(buffer, state, I, g)
+    elif engine == ENGINE_NUMPY:
+        if np is None:
+            raise ImportError("the '%s' engine needs NumPy" % engine)
+        _speech_voltmeter_numpy(buffer, state, I, g)
+    else:
+        raise ValueError("unknown speech voltmeter engine '%s'" % engine)
+    state.offset += state.n - n
+    if _profile is not None:
+        speech_voltmeter_profile_stage('meter', t0, state.n - n,
+                                       getattr(buffer, 'nbytes', 0))
+
+    # Statistics are recomputed by the next speech_voltmeter_finalize()
+    if state.n > 0:
+        state.stale = True
+
+def speech_voltmeter_finalize(state):
+
+    # Nothing accumulated since the statistics were last computed
+    if not state.stale:
+        return state.ActiveSpeechLevel
+
+    if _profile is not None:
+        t0 = time.perf_counter()
+    state.ActiveSpeechLevel = _speech_voltmeter_statistics(state)
+    state.stale = False
+    if _profile is not None:
+        speech_voltmeter_profile_stage('statistics', t0)
+    return state.ActiveSpeechLevel
+
+def speech_voltmeter(buffer, state, engine=ENGINE_REFERENCE):
+
+    speech_voltmeter_accumulate(buffer, state, engine)
+    return speech_voltmeter_finalize(state)
+
+def speech_voltmeter_pcm_accumulate(buffer, state, bitno=16):
+
+    # Same as speech_voltmeter_accumulate() with the NumPy engine, for
+    # integer PCM data of bitno bits (full scale 2^(bitno-1)-1) rather than
+    # normalized float data; the buffer (or memory map) is read directly.
+    # Sums of x*x of 16-bit data are exact, in int64.
+    if np is None:
+        raise ImportError("the PCM speech voltmeter needs NumPy")
+    x = np.asarray(buffer)
+    if x.dtype.kind not in 'iu':
+        raise TypeError("PCM data must be of an integer type, not %s" % x.dtype)
+
+    # Some initializations
+    I = math.floor(H * state.f + 0.5)
+    g = math.exp(-1.0 / (state.f * T))
+
+    if _profile is not None:
+        t0 = time.perf_counter()
+    n = state.n
+    _speech_voltmeter_numpy(x, state, I, g, (1 << (bitno - 1)) - 1)
+    state.offset += state.n - n
+    if _profile is not None:
+        speech_voltmeter_profile_stage('meter', t0, state.n - n, x.nbytes)
+
+    # Statistics are recomputed by the next speech_voltmeter_finalize()
+    if state.n > 0:
+        state.stale = True
+
+def speech_voltmeter_pcm(buffer, state, bitno=16):
+
+    speech_voltmeter_pcm_accumulate(buffer, state, bitno)
+    return speech_voltmeter_finalize(state)
+
+def _speech_voltmeter_statistics(state):
+
     # Computes the statistics
-    state.DCleven = state.s / state.n
-    LongTermLevel = 10 * math.log10(state.sq / state.n + MIN_LOG_OFFSET)
-    state.rmsdB = LongTermLevel - state.refdB
-    state.ActivityFactor = 0
+    (state.DClevel, state.rmsdB, state.ActivityFactor,
+     ActiveSpeechLevel) = _statistics(state.s, state.sq, state.n, state.a, state.c, state.refdB)
+    return ActiveSpeechLevel
+
+def _statistics(s, sq, n, a, c, refdB):
+
+    # DC level, RMS level, activity factor and active speech level of the
+    # sums s and sq of n samples, with activity counts a for thresholds c
+    DClevel = s / n
+    LongTermLevel = 10 * math.log10(sq / n + MIN_LOG_OFFSET)
+    rmsdB = LongTermLevel - refdB
+    ActivityFactor = 0
     ActiveSpeechLevel = -100.0
     
     # Test the lower active counter; if 0, is silence
-    if state.a[0] == 0:
-        return ActiveSpeechLevel
+    if a[0] == 0:
+        return DClevel, rmsdB, ActivityFactor, ActiveSpeechLevel
     else:
-       AdB = 10 * math.log10(((state.sq) / state.a[0]) + MIN_LOG_OFFSET)
+       AdB = 10 * math.log10(((sq) / a[0]) + MIN_LOG_OFFSET)
     
     # Test if the lower act.counter is below the margin: if yes, is silence
-    CdB = 20 * math.log10(float(state.c[0]))
+    CdB = 20 * math.log10(float(c[0]))
     if AdB - CdB < M:
-        ActiveSpeechLevel
+        return DClevel, rmsdB, ActivityFactor, ActiveSpeechLevel
         
     # Proceed serially for steps 2 and up -- this is the most common case
     Delta = [0.0 for i in range(THRES_NO)]
     for j in range(1, THRES_NO):
-        if state.a[j] != 0:
-            AdB = 10 * math.log10(((state.sq) / state.a[j]) + MIN_LOG_OFFSET)
-            CdB = 20 * math.log10((float(state.c[j])) + MIN_LOG_OFFSET)
+        if a[j] != 0:
+            AdB = 10 * math.log10(((sq) / a[j]) + MIN_LOG_OFFSET)
+            CdB = 20 * math.log10((float(c[j])) + MIN_LOG_OFFSET)
             Delta[j] = AdB - CdB
             # then interpolates to find the active
             # level and the activity factor and exits
             if Delta[j] <= M:
                 # AmdB is AdB for j-1, CmdB is CdB for j-1
-                AmdB = 10 * math.log10(((state.sq) / state.a[j - 1]) + MIN_LOG_OFFSET)
-                CmdB = 20 * math.log10(float(state.c[j - 1]) + MIN_LOG_OFFSET)
-                print(j, AdB, AmdB, CdB, CmdB)
+                AmdB = 10 * math.log10(((sq) / a[j - 1]) + MIN_LOG_OFFSET)
+                CmdB = 20 * math.log10(float(c[j - 1]) + MIN_LOG_OFFSET)
                 ActiveSpeechLevel = bin_interp(AdB, AmdB, CdB, CmdB, M, 0.5 )
                 
-                state.ActivityFactor = math.pow(10.0, ((LongTermLevel - ActiveSpeechLevel) / 10))
+                ActivityFactor = math.pow(10.0, ((LongTermLevel - ActiveSpeechLevel) / 10))
                 break
                 
-    return ActiveSpeechLevel
\ No newline at end of file
+    return DClevel, rmsdB, ActivityFactor, ActiveSpeechLevel
+
+def speech_voltmeter_partial(buffers, sampl_freq, warmup=()):
+
+    # Some initializations
+    partial = SVP56_partial()
+    init_speech_voltmeter(partial, sampl_freq)
+    I = math.floor(H * partial.f + 0.5)
+    g = math.exp(-1.0 / (partial.f * T))
+
+    # The envelope at the start of the shard is not known before the data
+    # preceding it are measured; it is estimated by running Process 2 over
+    # `warmup', the samples just before the shard, starting from zero. The
+    # estimate is checked against the true envelope when merging.
+    absx = np.abs(np.asarray(warmup, dtype=np.float64).ravel())
+    if len(absx) > 0:
+        p, q = _envelope_numpy(absx, partial.p, partial.q, g)
+        partial.p = float(p[-1])
+        partial.q = float(q[-1])
+    partial.p0 = partial.p
+    partial.q0 = partial.q
+
+    # Hangover counts start at I, so that nothing before the first sample
+    # above each threshold is counted; how many of these samples are to be
+    # counted depends on the hangover at the end of the previous shard, and
+    # only the first I of them can ever be
+    partial.first = [0] * THRES_NO
+    for buffer in buffers:
+        if _profile is not None:
+            t0 = time.perf_counter()
+        q = _speech_voltmeter_numpy(buffer, partial, I, g)
+        if _profile is not None:
+            speech_voltmeter_profile_stage('meter', t0, len(q),
+                                           getattr(buffer, 'nbytes', 0))
+        offset = partial.n - len(q)
+        if offset >= I:
+            continue
+        head = q[:I - offset]
+        for j in range(THRES_NO):
+            if partial.first[j] < offset:
+                continue
+            above = np.flatnonzero(head >= partial.c[j])
+            partial.first[j] = offset + (int(above[0]) if len(above) else len(head))
+
+    return partial
+
+def speech_voltmeter_merge(state, partial, buffers=()):
+
+    # The partial counts are only valid if the estimated envelope at the
+    # shard start is exactly the one the state ends with; otherwise the
+    # shard data in `buffers' are accumulated again
+    if state.p != partial.p0 or state.q != partial.q0:
+        for buffer in buffers:
+            speech_voltmeter_accumulate(buffer, state, ENGINE_NUMPY)
+        return False
+    if partial.n == 0:
+        return True
+
+    I = math.floor(H * state.f + 0.5)
+
+    # Samples before the first one above each threshold are counted while
+    # the hangover carried over from the state is below I
+    for j in range(THRES_NO):
+        state.a[j] += partial.a[j] + min(partial.first[j], max(0, I - state.hang[j]))
+        if partial.a[j] == 0:
+            state.hang[j] = min(I, state.hang[j] + partial.n)
+        else:
+            state.hang[j] = partial.hang[j]
+
+    # Process 1 and the envelope at the end of the shard
+    state.n  += partial.n
+    state.offset += partial.n
+    state.s  += partial.s
+    state.sq += partial.sq
+    state.p = partial.p
+    state.q = partial.q
+
+    # Max. absolute, positive and negative values
+    state.max = max(state.max, partial.max)
+    state.maxP = max(state.maxP, partial.maxP)
+    state.maxN = min(state.maxN, partial.maxN)
+
+    state.stale = True
+    return True
+
+def init_speech_voltmeter_array(state, sampl_freq, nsig):
+
+    # Same initial values as for a single signal, for each of the signals
+    single = SVP56_state()
+    init_speech_voltmeter(single, sampl_freq)
+    state.f = single.f
+    state.nsig = nsig
+    state.c = single.c
+    state.a = np.zeros((nsig, THRES_NO), dtype=np.int64)
+    state.hang = np.full((nsig, THRES_NO), single.hang[0], dtype=np.int64)
+    state.n = 0
+    state.s = np.zeros(nsig)
+    state.sq = np.zeros(nsig)
+    state.p = np.zeros(nsig)
+    state.q = np.zeros(nsig)
+    state.max = np.zeros(nsig)
+    state.maxP = np.full(nsig, single.maxP)
+    state.maxN = np.full(nsig, single.maxN)
+    state.refdB = single.refdB
+    state.rmsdB = np.zeros(nsig)
+    state.DClevel = np.zeros(nsig)
+    state.ActivityFactor = np.zeros(nsig)
+    state.ActiveSpeechLevel = np.full(nsig, -100.0)
+    state.stale = False
+    state.offset = 0
+
+def init_speech_voltmeter_array_from(state, states):
+
+    # Initializes the array state with the counts of single-signal states
+    # measured up to the same sample (the inverse of channel()), so that
+    # measuring can go on for all of them together
+    init_speech_voltmeter_array(state, states[0].f, len(states))
+    state.a[...] = [single.a for single in states]
+    state.hang[...] = [single.hang for single in states]
+    state.n = states[0].n
+    for name in ('s', 'sq', 'p', 'q', 'max', 'maxP', 'maxN'):
+        getattr(state, name)[...] = [getattr(single, name) for single in states]
+    state.offset = states[0].offset
+    state.stale = state.n > 0
+
+def speech_voltmeter_array_accumulate(buffer, state, interleaved=False, bitno=16):
+
+    # Some initializations
+    I = math.floor(H * state.f + 0.5)
+    g = math.exp(-1.0 / (state.f * T))
+
+    # Integer PCM data of bitno bits are measured as they are, against
+    # thresholds scaled to their full scale; only the sums and peaks are
+    # normalized. As in _speech_voltmeter_numpy(), their peaks and sums are
+    # taken on the buffer itself and only |x| is converted.
+    x = np.asarray(buffer)
+    integer = x.dtype.kind in 'iu'
+    scale = (1 << (bitno - 1)) - 1 if integer else 1
+    if not integer:
+        x = np.asarray(x, dtype=np.float64)
+
+    # One row per signal; interleaved data have one column per channel,
+    # and are copied once into contiguous rows
+    if interleaved:
+        x = np.ascontiguousarray(x.reshape(-1, state.nsig).T)
+    else:
+        x = np.ascontiguousarray(x.reshape(state.nsig, -1))
+    smpno = x.shape[1]
+    if smpno == 0:
+        return
+    if _profile is not None:
+        t0 = time.perf_counter()
+    absx = np.abs(x, dtype=np.float64)
+
+    # Max. absolute, positive and negative values
+    np.maximum(state.max, absx.max(axis=1) / scale, out=state.max)
+    np.maximum(state.maxP, x.max(axis=1) / scale, out=state.maxP)
+    np.minimum(state.maxN, x.min(axis=1) / scale, out=state.maxN)
+
+    # Implements Process 1 of P.56; the sums of each row are those of the
+    # signal measured alone
+    s, sq = _sums_numpy(x)
+    state.sq += sq / (scale * scale)
+    state.s  += s / scale
+    state.n  += smpno
+    state.offset += smpno
+
+    # Implements Process 2 of P.56 and applies threshold to the envelope q,
+    # for a group of signals at a time: the intermediate arrays of a group
+    # stay in cache
+    c = [c * scale for c in state.c]
+    rows = max(1, ARRAY_BLOCK // smpno)
+    for i in range(0, state.nsig, rows):
+        group = slice(i, i + rows)
+        p, q = _envelope_numpy(absx[group], state.p[group] * scale, state.q[group] * scale, g)
+        state.p[group] = p[:, -1] / scale
+        state.q[group] = q[:, -1] / scale
+        _activity_numpy(q, c, state.a[group], state.hang[group], I)
+
+    state.stale = True
+    if _profile is not None:
+        speech_voltmeter_profile_stage('meter', t0, smpno * state.nsig, x.nbytes)
+
+def speech_voltmeter_array_finalize(state):
+
+    # Nothing accumulated since the statistics were last computed
+    if not state.stale:
+        return state.ActiveSpeechLevel
+
+    # The statistics of each signal are those of a single-signal state
+    if _profile is not None:
+        t0 = time.perf_counter()
+    a = state.a.tolist()
+    for i in range(state.nsig):
+        (state.DClevel[i], state.rmsdB[i], state.ActivityFactor[i],
+         state.ActiveSpeechLevel[i]) = _statistics(float(state.s[i]), float(state.sq[i]),
+                                                   state.n, a[i], state.c, state.refdB)
+    state.stale = False
+    if _profile is not None:
+        speech_voltmeter_profile_stage('statistics', t0)
+    return state.ActiveSpeechLevel
+
+def speech_voltmeter_array(buffer, state, interleaved=False, bitno=16):
+
+    speech_voltmeter_array_accumulate(buffer, state, interleaved, bitno)
+    return speech_voltmeter_array_finalize(state)
+
+def init_speech_voltmeter_hist(state, sampl_freq, steps=HIST_STEPS):
+
+    # First initializations
+    state.f = sampl_freq
+    state.steps = steps
+    state.step = max(1, math.floor(HIST_DT * state.f + 0.5))
+
+    # Grid of thresholds, `steps' per octave from 2^-15 up to 1; it contains
+    # the 15 thresholds of init_speech_voltmeter exactly
+    state.c = [2.0 ** (k / steps - 15) for k in range(15 * steps + 1)]
+
+    # Envelope and gap histograms; the last gap bin gathers all gaps longer
+    # than the largest hangover
+    K = len(state.c)
+    B = math.ceil(HIST_HMAX * state.f / state.step)
+    state.hist = np.zeros(K + 1, dtype=np.int64)
+    state.gapno = np.zeros((K, B + 1), dtype=np.int64)
+    state.gapsum = np.zeros((K, B + 1), dtype=np.int64)
+    state.run = np.full(K, -1, dtype=np.int64)
+
+    # Inicialization for the quantities used in the two P.56's processes
+    state.s = state.sq = state.n = state.p = state.q = 0
+
+    # Inicialization of other quantities referring to state variables
+    state.max = 0
+    state.maxP = -32768.0
+    state.maxN = 32767.0
+    state.refdB = 0 # dBov
+
+def _hist_gaps(state, k, gaps):
+
+    # Adds gap lengths to the gap histogram of threshold k
+    gaps = gaps[gaps > 0]
+    if len(gaps) == 0:
+        return
+    B = state.gapno.shape[1] - 1
+    bins = np.minimum(gaps // state.step, B)
+    state.gapno[k] += np.bincount(bins, minlength=B + 1)
+    state.gapsum[k] += np.bincount(bins, weights=gaps, minlength=B + 1).astype(np.int64)
+
+def speech_voltmeter_hist_accumulate(buffer, state):
+
+    # Some initializations
+    g = math.exp(-1.0 / (state.f * T))
+
+    x = np.asarray(buffer, dtype=np.float64).ravel()
+    smpno = len(x)
+    if smpno == 0:
+        return
+    absx = np.abs(x)
+
+    # Max. absolute, positive and negative values
+    state.max = max(state.max, float(absx.max()))
+    state.maxP = max(state.maxP, float(x.max()))
+    state.maxN = min(state.maxN, float(x.min()))
+
+    # Implements Process 1 of P.56
+    state.sq += float(np.sum(x * x))
+    state.s  += float(x.sum())
+    state.n  += smpno
+
+    # Implements Process 2 of P.56
+    p, q = _envelope_numpy(absx, state.p, state.q, g)
+    state.p = float(p[-1])
+    state.q = float(q[-1])
+
+    # Envelope histogram: a sample is above grid threshold k when more than
+    # k grid thresholds are at or below its envelope
+    lvl = np.searchsorted(state.c, q, side='right')
+    state.hist += np.bincount(lvl, minlength=len(state.c) + 1)
+
+    # Gaps for thresholds all samples are above: the open gaps are closed
+    lo = int(lvl.min())
+    hi = int(lvl.max())
+    for k in range(lo):
+        _hist_gaps(state, k, state.run[k:k+1])
+    state.run[:lo] = 0
+
+    # Thresholds no sample is above: the open gaps go on
+    state.run[hi:][state.run[hi:] >= 0] += smpno
+
+    # Other thresholds: gaps between consecutive samples above it; the
+    # first one continues the gap open at the end of the previous call
+    for k in range(lo, hi):
+        pos = np.flatnonzero(lvl > k)
+        gaps = np.diff(pos) - 1
+        if state.run[k] >= 0:
+            gaps = np.append(gaps, state.run[k] + pos[0])
+        _hist_gaps(state, k, gaps)
+        state.run[k] = smpno - 1 - pos[-1]
+
+def speech_voltmeter_hist_counts(state, thresholds=None, Hang=H):
+
+    # Activity counts for thresholds of the grid (by default, all of them)
+    # with a hangover of Hang seconds. A sample is active if its envelope is
+    # at or above the threshold, or if it is in the first I samples of a gap.
+    # Counts are exact when I is a multiple of the gap bin width; otherwise
+    # the gaps in the bin containing I count the lesser of their total
+    # length and I samples each.
+    I = math.floor(Hang * state.f + 0.5)
+    B = state.gapno.shape[1] - 1
+    if I > B * state.step:
+        raise ValueError("hangover longer than %s s" % HIST_HMAX)
+    if thresholds is None:
+        index = range(len(state.c))
+    else:
+        try:
+            index = [state.c.index(c) for c in thresholds]
+        except ValueError:
+            raise ValueError("thresholds must be on the grid of the state")
+
+    # Samples above each threshold, from the envelope histogram
+    above = np.cumsum(state.hist[::-1])[::-1]
+
+    # Gaps shorter than the bin containing I count whole, longer ones count
+    # I samples; so does the gap left open at the end of the data
+    bI = I // state.step
+    a = above[1:] + state.gapsum[:, :bI].sum(axis=1)
+    a += I * state.gapno[:, bI+1:].sum(axis=1)
+    if bI <= B:
+        a += np.minimum(state.gapsum[:, bI], I * state.gapno[:, bI])
+    a += np.clip(state.run, 0, I)
+    return a[list(index)].tolist()
+
+def speech_voltmeter_hist_level(state, Margin=M, Hang=H):
+
+    # Active speech level for a margin of Margin dB and a hangover of Hang
+    # seconds, and the activity factor. As in speech_voltmeter, the level is
+    # found where the difference between the level of the active samples
+    # and the threshold crosses the margin; here every grid threshold is
+    # tried and the crossing is interpolated linearly between the two grid
+    # thresholds around it, rather than by bin_interp().
+    ActivityFactor = 0.0
+    ActiveSpeechLevel = -100.0
+    if state.n == 0:
+        return ActiveSpeechLevel, ActivityFactor
+    LongTermLevel = 10 * math.log10(state.sq / state.n + MIN_LOG_OFFSET)
+
+    a = speech_voltmeter_hist_counts(state, None, Hang)
+
+    # Test the lower active counter; if 0, is silence
+    if a[0] == 0:
+        return ActiveSpeechLevel, ActivityFactor
+    AmdB = 10 * math.log10((state.sq / a[0]) + MIN_LOG_OFFSET)
+    CmdB = 20 * math.log10(state.c[0])
+
+    # Test if the lower act.counter is below the margin: if yes, is silence
+    if AmdB - CmdB < Margin:
+        return ActiveSpeechLevel, ActivityFactor
+
+    for k in range(1, len(state.c)):
+        if a[k] == 0:
+            break
+        AdB = 10 * math.log10((state.sq / a[k]) + MIN_LOG_OFFSET)
+        CdB = 20 * math.log10(state.c[k])
+        if AdB - CdB <= Margin:
+            x = ((AmdB - CmdB) - Margin) / ((AmdB - CmdB) - (AdB - CdB))
+            ActiveSpeechLevel = AmdB + x * (AdB - AmdB)
+            ActivityFactor = math.pow(10.0, ((LongTermLevel - ActiveSpeechLevel) / 10))
+            break
+        AmdB, CmdB = AdB, CdB
+
+    return ActiveSpeechLevel, ActivityFactor
+
+def _index_blocks(x, state, hang, I, g, N):
+
+    # Records of the blocks of x; the envelope and the hangover counts are
+    # carried over in state and hang
+    smpno = len(x)
+    nb = -(-smpno // N)
+    state.n += smpno
+    absx = np.abs(x)
+    p, q = _envelope_numpy(absx, state.p, state.q, g)
+    state.p = float(p[-1])
+    state.q = float(q[-1])
+
+    pad = nb * N - smpno
+    rec = np.zeros(nb, dtype=INDEX_RECORD)
+    rec['s'] = np.pad(x, (0, pad)).reshape(nb, N).sum(axis=1)
+    rec['sq'] = np.pad(x * x, (0, pad)).reshape(nb, N).sum(axis=1)
+    idx = np.arange(smpno)
+    ends = np.minimum(np.arange(1, nb + 1) * N, smpno) - 1
+    for j in range(THRES_NO):
+        above = q >= state.c[j]
+        last = np.where(above, idx, -1)
+        np.maximum.accumulate(last, out=last)
+        hangj = np.where(last >= 0, idx - last - 1, hang[j] + idx)
+        counted = above | (hangj < I)
+        after = np.where(above, 0, np.minimum(hangj + 1, I))
+        above = np.pad(above, (0, pad)).reshape(nb, N)
+        rec['a'][:, j] = np.pad(counted, (0, pad)).reshape(nb, N).sum(axis=1)
+        rec['hang'][:, j] = after[ends]
+        rec['first'][:, j] = np.where(above.any(axis=1), above.argmax(axis=1), N)
+        hang[j] = int(after[-1])
+    return rec
+
+def speech_voltmeter_index(buffers, sampl_freq, N=INDEX_BLOCK):
+
+    # Some initializations
+    state = SVP56_state()
+    init_speech_voltmeter(state, sampl_freq)
+    I = math.floor(H * state.f + 0.5)
+    g = math.exp(-1.0 / (state.f * T))
+    hang = list(state.hang)
+
+    # Per-block sums and activity counts, hangover counts at the end of each
+    # block, and position of the first sample above each threshold in each
+    # block (N if none)
+    blocks = []
+    rest = np.zeros(0)
+
+    # Whole blocks are indexed as the data arrive; the remaining samples
+    # wait for the next buffer
+    for buffer in buffers:
+        x = np.concatenate((rest, np.asarray(buffer, dtype=np.float64).ravel()))
+        whole = len(x) // N * N
+        if whole > 0:
+            blocks.append(_index_blocks(x[:whole], state, hang, I, g, N))
+        rest = x[whole:]
+    if len(rest) > 0:
+        blocks.append(_index_blocks(rest, state, hang, I, g, N))
+
+    # Prefix records: sums and counts before each boundary, hangover at it
+    rec = np.concatenate(blocks) if blocks else np.zeros(0, dtype=INDEX_RECORD)
+    nb = len(rec)
+    n = state.n
+    table = np.zeros(nb + 1, dtype=INDEX_RECORD)
+    table['s'][1:] = np.cumsum(rec['s'])
+    table['sq'][1:] = np.cumsum(rec['sq'])
+    table['a'][1:] = np.cumsum(rec['a'], axis=0)
+    table['hang'][0] = I
+    table['hang'][1:] = rec['hang']
+
+    # Samples from each boundary to the next one above each threshold: in
+    # the block itself, or in the next block with a sample above
+    b = np.arange(nb)
+    for j in range(THRES_NO):
+        first = rec['first'][:, j]
+        nxt = np.where(first < N, b, nb)
+        nxt = np.minimum.accumulate(nxt[::-1])[::-1]
+        dist = np.where(nxt < nb, (nxt - b) * N + first[np.minimum(nxt, nb - 1)], n - b * N)
+        table['first'][:nb, j] = np.minimum(dist, I)
+
+    index = SVP56_index()
+    index.f = state.f
+    index.N = N
+    index.n = n
+    index.table = table
+    return index
+
+def speech_voltmeter_index_query(index, start, end, hangover_in=False):
+
+    # Statistics of the samples start..end-1, widened to whole blocks, in a
+    # SVP56_state ready for the SVP56_get_* getters (peaks are not indexed
+    # and are NaN). The counts are those of the measurement of the whole
+    # signal, restricted to the range:
+    # - the envelope at the range start is the one left by the preceding
+    #   data, not a fresh one rising from zero, so the first few time
+    #   constants T of the range may be counted differently than by a
+    #   measurement of the range alone;
+    # - the samples counted only because of the hangover of activity before
+    #   the range are removed, as a fresh measurement would not count them,
+    #   unless hangover_in is set.
+    # Ranges that start past the end of the signal, or that are empty, are
+    # rejected.
+    start, end = int(start), int(end)
+    if start >= index.n or end <= max(start, 0):
+        raise ValueError("empty or out of range samples %d..%d of %d" % (start, end, index.n))
+    table = index.table
+    sb = max(0, start // index.N)
+    eb = min(-(-end // index.N), len(table) - 1)
+    smpno = min(eb * index.N, index.n) - sb * index.N
+
+    state = SVP56_state()
+    init_speech_voltmeter(state, index.f)
+    I = math.floor(H * state.f + 0.5)
+    a = table['a'][eb] - table['a'][sb]
+    if not hangover_in:
+        spill = np.minimum(table['first'][sb], I - table['hang'][sb])
+        a -= np.minimum(spill, smpno)
+    state.a = a.tolist()
+    state.n = smpno
+    state.s = float(table['s'][eb] - table['s'][sb])
+    state.sq = float(table['sq'][eb] - table['sq'][sb])
+    state.max = state.maxP = state.maxN = float('nan')
+    state.stale = smpno > 0
+    return state
+
+def speech_voltmeter_index_save(index, path):
+
+    # Header with the block size and length of the signal, then the records
+    with open(path, 'wb') as fid:
+        fid.write(INDEX_HEADER.pack(INDEX_MAGIC, index.f, index.N, index.n).ljust(INDEX_OFFSET, b'\0'))
+        index.table.tofile(fid)
+
+def speech_voltmeter_index_load(path):
+
+    # The records are memory-mapped, not read
+    with open(path, 'rb') as fid:
+        magic, f, N, n = INDEX_HEADER.unpack(fid.read(INDEX_OFFSET)[:INDEX_HEADER.size])
+    if magic != INDEX_MAGIC:
+        raise ValueError("'%s' is not a speech voltmeter index" % path)
+    index = SVP56_index()
+    index.f = f
+    index.N = N
+    index.n = n
+    index.table = np.memmap(path, dtype=INDEX_RECORD, mode='r', offset=INDEX_OFFSET,
+                            shape=(-(-n // N) + 1,))
+    return index
+
+def speech_voltmeter_state_pack(state):
+
+    # Everything needed to go on measuring, in STATE_STRUCT.size bytes; the
+    # thresholds follow from the sampling frequency and the statistics are
+    # recomputed
+    return STATE_STRUCT.pack(STATE_MAGIC, state.f, state.n, state.offset,
+                             state.s, state.sq, state.p, state.q, state.max,
+                             state.maxP, state.maxN, state.refdB,
+                             *(list(state.a) + list(state.hang)))
+
+def speech_voltmeter_state_unpack(data):
+
+    # Inverse of speech_voltmeter_state_pack()
+    fields = STATE_STRUCT.unpack(data)
+    if fields[0] != STATE_MAGIC:
+        raise ValueError("not a serialized speech voltmeter state")
+    state = SVP56_state()
+    init_speech_voltmeter(state, fields[1])
+    (state.n, state.offset, state.s, state.sq, state.p, state.q, state.max,
+     state.maxP, state.maxN, state.refdB) = fields[2:12]
+    state.a = list(fields[12:12 + THRES_NO])
+    state.hang = list(fields[12 + THRES_NO:])
+    state.stale = state.n > 0
+    return state
+
+def speech_voltmeter_state_save(states, path):
+
+    # Checkpoints a list of states (e.g. the channels of a file, or many
+    # streams) to a file of fixed-size records; the file is replaced
+    # atomically, so a reader never sees a partial checkpoint
+    temp = path + '.tmp'
+    with open(temp, 'wb') as fid:
+        for state in states:
+            fid.write(speech_voltmeter_state_pack(state))
+    os.replace(temp, path)
+
+def speech_voltmeter_state_load(path):
+
+    # States checkpointed by speech_voltmeter_state_save()
+    with open(path, 'rb') as fid:
+        data = fid.read()
+    if len(data) % STATE_STRUCT.size:
+        raise ValueError("'%s' is not a speech voltmeter checkpoint" % path)
+    return [speech_voltmeter_state_unpack(data[i:i + STATE_STRUCT.size])
+            for i in range(0, len(data), STATE_STRUCT.size)]
+
+def init_speech_voltmeter_window(window, sampl_freq, length):
+
+    # Window of `length' seconds
+    window.f = sampl_freq
+    window.length = max(1, math.floor(length * window.f + 0.5))
+    window.state = SVP56_state()
+    init_speech_voltmeter(window.state, sampl_freq)
+    window.blocks = deque()
+    window.seq = 0
+    window.n = 0
+    window.s = 0.0
+    window.sq = 0.0
+    window.a = [0] * THRES_NO
+    window.peaks = (deque(), deque(), deque())
+    window.stats = SVP56_state()
+    init_speech_voltmeter(window.stats, sampl_freq)
+
+def speech_voltmeter_window(buffer, window):
+
+    # Some initializations
+    state = window.state
+    I = math.floor(H * state.f + 0.5)
+    g = math.exp(-1.0 / (state.f * T))
+
+    # Measures the block, keeping the hangover counts at its start
+    x = np.asarray(buffer, dtype=np.float64).ravel()
+    if len(x) == 0:
+        return speech_voltmeter_finalize(window.stats)
+    a = list(state.a)
+    hang = list(state.hang)
+    s, sq = state.s, state.sq
+    q = _speech_voltmeter_numpy(x, state, I, g)
+
+    # Contribution of the block, with the first sample above each threshold
+    a = [state.a[j] - a[j] for j in range(THRES_NO)]
+    first = [len(x)] * THRES_NO
+    for j in range(THRES_NO):
+        above = np.flatnonzero(q >= state.c[j])
+        if len(above):
+            first[j] = int(above[0])
+    block = (window.seq, len(x), state.s - s, state.sq - sq, a, hang, first)
+    window.blocks.append(block)
+    window.n += len(x)
+    window.s += block[2]
+    window.sq += block[3]
+    window.a = [window.a[j] + a[j] for j in range(THRES_NO)]
+
+    # Peaks of the blocks that can still be the peak of the window
+    for peaks, value in zip(window.peaks, (np.abs(x).max(), x.max(), -x.min())):
+        while peaks and peaks[-1][1] <= value:
+            peaks.pop()
+        peaks.append((window.seq, float(value)))
+    window.seq += 1
+
+    # Evicts the oldest blocks not needed to cover the window length
+    while window.n - window.blocks[0][1] >= window.length:
+        old = window.blocks.popleft()
+        window.n -= old[1]
+        window.s -= old[2]
+        window.sq -= old[3]
+        window.a = [window.a[j] - old[4][j] for j in range(THRES_NO)]
+    for peaks in window.peaks:
+        while peaks[0][0] < window.blocks[0][0]:
+            peaks.popleft()
+
+    # Sums are recomputed once per window length of blocks, so that
+    # rounding errors do not build up
+    if window.seq % len(window.blocks) == 0:
+        window.s = math.fsum(block[2] for block in window.blocks)
+        window.sq = math.fsum(block[3] for block in window.blocks)
+
+    # Statistics of the window. As in speech_voltmeter_index_query, the
+    # samples counted only because of the hangover of activity before the
+    # window are removed; they are within I samples of its start.
+    hang = window.blocks[0][5]
+    a = list(window.a)
+    for j in range(THRES_NO):
+        dist = 0
+        for block in window.blocks:
+            if block[6][j] < block[1] or dist + block[1] >= I:
+                dist += block[6][j]
+                break
+            dist += block[1]
+        a[j] -= min(dist, I - hang[j], I)
+    stats = window.stats
+    stats.a = a
+    stats.n = window.n
+    stats.s = window.s
+    stats.sq = window.sq
+    stats.max = window.peaks[0][0][1]
+    stats.maxP = window.peaks[1][0][1]
+    stats.maxN = -window.peaks[2][0][1]
+    stats.stale = True
+    return speech_voltmeter_finalize(stats)
+
+def speech_voltmeter_window_stream(buffers, sampl_freq, length):
+
+    # Yields the active speech level and the statistics (a SVP56_state,
+    # updated in place) of the last `length' seconds after each block;
+    # buffers may be any iterable, e.g. blocks read from a pipe or socket
+    window = SVP56_window()
+    init_speech_voltmeter_window(window, sampl_freq, length)
+    for buffer in buffers:
+        yield speech_voltmeter_window(buffer, window), window.stats
+
+def speech_voltmeter_profile(profile):
+
+    # Installs a SVP56_profile, in which the stages run from now on are
+    # recorded, or removes it (profile None); returns the profile installed
+    # before. Without a profile, the cost is that of one test per call.
+    global _profile
+    previous, _profile = _profile, profile
+    return previous
+
+def speech_voltmeter_profile_installed():
+
+    # The SVP56_profile installed, or None
+    return _profile
+
+def speech_voltmeter_profile_stage(stage, t0, samples=0, nbytes=0):
+
+    # Records a run of `stage', started at time.perf_counter() t0, over
+    # `samples' samples of `nbytes' bytes, in the profile installed (if any)
+    profile = _profile
+    if profile is None:
+        return
+    elapsed = time.perf_counter() - t0
+    record = profile.stages.get(stage)
+    if record is None:
+        record = profile.stages[stage] = {'calls': 0, 'time': 0.0,
+                                          'samples': 0, 'bytes': 0}
+    record['calls'] += 1
+    record['time'] += elapsed
+    record['samples'] += samples
+    record['bytes'] += nbytes
+    if profile.callback is not None:
+        profile.callback(stage, elapsed, samples, nbytes)
+
+def speech_voltmeter_profile_merge(stages):
+
+    # Adds the stage records of another profile (e.g. the `stages' of the
+    # profile of a worker process) to the profile installed, if any; their
+    # times add up, whatever the processes ran in parallel
+    profile = _profile
+    if profile is None:
+        return
+    for stage, other in stages.items():
+        record = profile.stages.setdefault(stage, {'calls': 0, 'time': 0.0,
+                                                   'samples': 0, 'bytes': 0})
+        for name in record:
+            record[name] += other[name]
+
+def speech_voltmeter_profile_report(profile):
+
+    # The records of a profile and the peak resident memory of the process
+    # (and of its terminated children, e.g. worker processes), in bytes, if
+    # known; only plain types, so it can be dumped as JSON
+    report = {'stages': {stage: dict(record) for stage, record in profile.stages.items()},
+              'bin_interp': {'calls': profile.interps,
+                             'iterations': profile.iterations,
+                             'relaxations': profile.relaxations},
+              'peak_rss': None, 'peak_rss_children': None}
+    if resource is not None:
+        # ru_maxrss is in kilobytes, but in bytes on macOS
+        unit = 1 if sys.platform == 'darwin' else 1024
+        report['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+        report['peak_rss_children'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return report